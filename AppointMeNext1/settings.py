@@ -37,6 +37,129 @@ ALLOWED_HOSTS = []
 
 LOGIN_REDIRECT_URL = '/dashboard/'
 
+# How long a customer keeps a time slot reserved after selecting it in the booking form
+SLOT_HOLD_TTL_SECONDS = 5 * 60
+
+# How long a stored response is replayed for retries carrying the same Idempotency-Key
+IDEMPOTENCY_KEY_TTL_SECONDS = 24 * 60 * 60
+# A key still waiting for its first response after this long belongs to a request whose worker died, and a retry takes it over
+IDEMPOTENCY_PENDING_TIMEOUT_SECONDS = 30
+
+# Maximum number of SQL queries per request, by URL name and optionally by method; requests over budget are
+# logged as warnings. The budgets are the worst cases measured by QueryBudgetTestCase
+QUERY_BUDGETS = {
+    # GET: first visit, which also creates the calendar token; POST: idempotent booking with a reminder
+    'dashboard': {'GET': 8, 'POST': 18},
+    # Creating missing business hours, with the appointment list not cached and read from the archive too
+    'owner_dashboard': 9,
+    # A window reaching into the archive
+    'get_appointments': 5,
+    'get_available_hours': 5,
+    # Session, user and business hours, then up to three per window for BusinessHours.NEXT_AVAILABLE_MAX_WINDOWS (4)
+    'next_available': 3 + 3 * 4,
+    'cancel_appointment': 8,
+}
+QUERY_BUDGET_DEFAULT = None
+
+# Queries slower than this are written to the slow query log, see `python manage.py slow_queries`
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG = BASE_DIR / 'logs' / 'slow_queries.log'
+
+# Request profiles, see appointments/profiling.py; the least recently used are deleted beyond the size limit
+PROFILE_DIR = BASE_DIR / 'logs' / 'profiles'
+PROFILE_STORAGE_MAX_BYTES = 50 * 1024 * 1024
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+
+# Per-worker metric files merged by /metrics, see appointments/metrics.py
+METRICS_DIR = BASE_DIR / 'logs' / 'metrics'
+METRICS_FLUSH_SECONDS = 5
+# When set, /metrics requires an "Authorization: Bearer <token>" header
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Share of requests traced, and where their spans are written, see appointments/tracing.py
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_LOG = BASE_DIR / 'logs' / 'traces.jsonl'
+
+# How long the anonymous home, login and registration pages are cached, in seconds
+ANONYMOUS_PAGE_CACHE_SECONDS = 10 * 60
+
+CACHES = {
+    'default': {
+        'BACKEND': 'appointments.metrics.LocMemCache',
+        'LOCATION': 'default',
+    },
+}
+
+# Level of the app's console log, and the share of its DEBUG records kept for busy request paths
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.1'))
+
+# Handlers run on QueueListener threads, see appointments/log.py
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampled': {
+            '()': 'appointments.log.SamplingFilter',
+            'rate': LOG_SAMPLE_RATE,
+            # INFO records such as rejected registrations are all kept
+            'max_level': 'DEBUG',
+        },
+    },
+    'formatters': {
+        'structured': {
+            '()': 'appointments.log.StructuredFormatter',
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+        'json': {
+            '()': 'appointments.slow_queries.JsonFormatter',
+        },
+        'message': {
+            'format': '%(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'structured',
+        },
+        'slow_queries': {
+            # Opens settings.SLOW_QUERY_LOG, creating its directory, when the first record is written
+            'class': 'appointments.log.SettingFileHandler',
+            'setting': 'SLOW_QUERY_LOG',
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'json',
+        },
+        'traces': {
+            'class': 'appointments.log.SettingFileHandler',
+            'setting': 'TRACE_LOG',
+            'maxBytes': 50 * 1024 * 1024,
+            'backupCount': 3,
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'appointments': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+        },
+        'appointments.views': {
+            'filters': ['sampled'],
+        },
+        'appointments.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'appointments.tracing': {
+            'handlers': ['traces'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -50,6 +173,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'appointments.middleware.MetricsMiddleware',
+    'appointments.middleware.QueryBudgetMiddleware',
+    'appointments.middleware.SlowQueryMiddleware',
+    'appointments.middleware.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +184,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'appointments.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'AppointMeNext1.urls'
@@ -128,13 +256,34 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Without DEBUG, collectstatic writes content-hashed copies with gzip (and, if the brotli package is
+# installed, brotli) variants, served by appointments.views.static_asset with far-future cache headers
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'appointments.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+
+# Uploaded and generated files (PDF reports)
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# SMTP, recording send latency and failures for /metrics
+EMAIL_BACKEND = 'appointments.metrics.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587  # Use the appropriate port for your SMTP server
 EMAIL_USE_TLS = True
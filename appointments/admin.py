@@ -1,8 +1,9 @@
 from django.contrib import admin
 from .models import UserProfile
 from django.contrib import admin
-from .models import BusinessHours
+from .models import BusinessHours, SlotHold
 
 admin.site.register(UserProfile)
 
-admin.site.register(BusinessHours)
\ No newline at end of file
+admin.site.register(BusinessHours)
+admin.site.register(SlotHold)
@@ -0,0 +1,193 @@
+"""
+Analytics Module
+
+
+This module computes the owner utilization report. Appointments are counted with one GROUP BY query per table
+(day, hour, status), appointments canceled by deleting them are counted from their change log entries, and
+everything else (bookings per day, cancellation rate, the weekday/hour utilization
+heatmap against the BusinessHours capacity) is derived from those counts with NumPy and pandas, so the cost
+of a report does not grow with the number of appointment rows loaded into Python.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+
+from .archive import archive_horizon
+from .models import Appointment, AppointmentArchive, AppointmentChange, BusinessHours
+
+
+# Cached reports are keyed by the latest change log entry, so this only bounds how long unused entries live
+ANALYTICS_CACHE_SECONDS = 60 * 60
+
+COUNT_COLUMNS = ['day', 'hour', 'status', 'count']
+
+
+def count_appointments(start_date, end_date):
+
+    """
+    Count appointments per day, hour and status.
+
+    Runs one GROUP BY over Appointment, plus one over AppointmentArchive when the period reaches into it, and
+    one over the 'cancel' change log entries of appointments that were deleted, which is how customers cancel.
+
+    Parameters:
+        start_date (date): First day of the period.
+        end_date (date): Last day of the period (inclusive).
+
+    Returns:
+        DataFrame: One row per (day, hour, status) with the number of appointments.
+    """
+
+    start = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+
+    models = [Appointment]
+    horizon = archive_horizon()
+    if horizon is not None and start <= horizon:
+        models.append(AppointmentArchive)
+
+    rows = []
+    for model in models:
+        rows.extend(
+            model.objects.filter(date_time__gte=start, date_time__lt=end)
+            .annotate(day=TruncDate('date_time'), hour=ExtractHour('date_time'))
+            .values('day', 'hour', 'status')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+
+    # Appointments canceled with Appointment.delete() only have their log entry left
+    deleted = (
+        AppointmentChange.objects.filter(action='cancel', date_time__gte=start, date_time__lt=end)
+        .exclude(appointment_id__in=Appointment.objects.values('id'))
+        .exclude(appointment_id__in=AppointmentArchive.objects.values('id'))
+        .annotate(day=TruncDate('date_time'), hour=ExtractHour('date_time'))
+        .values('day', 'hour')
+        .annotate(count=Count('appointment_id', distinct=True))
+        .order_by()
+    )
+    rows.extend(dict(row, status='canceled') for row in deleted)
+
+    counts = pd.DataFrame.from_records(rows, columns=COUNT_COLUMNS)
+    # Rows of the same group can come from both tables
+    return counts.groupby(['day', 'hour', 'status'], as_index=False)['count'].sum()
+
+
+def slot_capacity(business_hours):
+
+    """
+    Build the weekly slot capacity.
+
+    Parameters:
+        business_hours (BusinessHours): The business hours.
+
+    Returns:
+        ndarray: A 7x24 array (Monday first) with the number of one-hour slots starting in each hour.
+    """
+
+    capacity = np.zeros((7, 24), dtype=np.int64)
+    for weekday, (day, _) in enumerate(BusinessHours.DAYS_OF_WEEK):
+        open_time = business_hours.get_open_hours(day)
+        close_time = business_hours.get_close_hours(day)
+        open_minutes = open_time.hour * 60 + open_time.minute
+        close_minutes = close_time.hour * 60 + close_time.minute
+        slot_starts = np.arange(open_minutes, close_minutes - 59, 60)
+        capacity[weekday, slot_starts // 60] = 1
+    return capacity
+
+
+def build_report(start_date, end_date, business_hours):
+
+    """
+    Build the owner utilization report for a period.
+
+    Parameters:
+        start_date (date): First day of the period.
+        end_date (date): Last day of the period (inclusive).
+        business_hours (BusinessHours): The business hours defining the capacity.
+
+    Returns:
+        dict: Totals, bookings per day and the weekday/hour utilization heatmap.
+    """
+
+    counts = count_appointments(start_date, end_date)
+    days = pd.date_range(start_date, end_date, freq='D')
+
+    # Bookings and cancellations per day, with zeros for days without appointments
+    per_day = (
+        counts.groupby(['day', 'status'])['count'].sum()
+        .unstack(fill_value=0)
+        .reindex(index=days.date, columns=['scheduled', 'canceled'], fill_value=0)
+    )
+    bookings = per_day['scheduled'].to_numpy() + per_day['canceled'].to_numpy()
+    canceled = per_day['canceled'].to_numpy()
+
+    # Scheduled appointments per weekday and hour against the slots available in the period
+    scheduled = counts[counts['status'] == 'scheduled']
+    booked = np.zeros((7, 24), dtype=np.int64)
+    if not scheduled.empty:
+        weekdays = pd.to_datetime(scheduled['day']).dt.weekday.to_numpy()
+        np.add.at(booked, (weekdays, scheduled['hour'].to_numpy(dtype=np.int64)), scheduled['count'].to_numpy())
+
+    occurrences = np.bincount(days.weekday, minlength=7)
+    capacity = slot_capacity(business_hours) * occurrences[:, None]
+    utilization = np.divide(booked, capacity, out=np.zeros((7, 24)), where=capacity > 0)
+
+    total_bookings = int(bookings.sum())
+    total_canceled = int(canceled.sum())
+
+    return {
+        'period': {'start': start_date.isoformat(), 'end': end_date.isoformat()},
+        'totals': {
+            'bookings': total_bookings,
+            'canceled': total_canceled,
+            'cancellation_rate': round(total_canceled / total_bookings, 4) if total_bookings else 0.0,
+            'utilization': round(float(booked.sum() / capacity.sum()), 4) if capacity.sum() else 0.0,
+        },
+        'bookings_per_day': [
+            {'date': day.isoformat(), 'bookings': int(day_bookings), 'canceled': int(day_canceled)}
+            for day, day_bookings, day_canceled in zip(days.date, bookings, canceled)
+        ],
+        'utilization': {
+            'weekdays': [label for _, label in BusinessHours.DAYS_OF_WEEK],
+            'hours': list(range(24)),
+            'matrix': np.round(utilization, 4).tolist(),
+        },
+    }
+
+
+def owner_report(start_date, end_date, business_hours):
+
+    """
+    Get the owner utilization report for a period, from the cache when possible.
+
+    The cache key includes the latest appointment change and the business hours, so a cached report is
+    reused until an appointment in the system or the capacity changes.
+
+    Parameters:
+        start_date (date): First day of the period.
+        end_date (date): Last day of the period (inclusive).
+        business_hours (BusinessHours): The business hours defining the capacity.
+
+    Returns:
+        dict: The report, as returned by build_report().
+    """
+
+    last_change = AppointmentChange.objects.order_by('-id').values_list('id', flat=True).first()
+    hours_key = '-'.join(
+        f'{business_hours.get_open_hours(day):%H%M}{business_hours.get_close_hours(day):%H%M}'
+        for day, _ in BusinessHours.DAYS_OF_WEEK
+    )
+    cache_key = f'owner_analytics:{start_date:%Y%m%d}:{end_date:%Y%m%d}:{last_change}:{hours_key}'
+
+    report = cache.get(cache_key)
+    if report is None:
+        report = build_report(start_date, end_date, business_hours)
+        cache.set(cache_key, report, ANALYTICS_CACHE_SECONDS)
+    return report
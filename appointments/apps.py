@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AppointmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'appointments'
+
+    def ready(self):
+        # Log I/O runs on listener threads instead of the request thread
+        from .log import install_queue_logging
+        install_queue_logging()
@@ -0,0 +1,198 @@
+"""
+Archive Module
+
+
+This module moves past appointments from the Appointment table into AppointmentArchive and reads them back.
+Keeping only recent and upcoming appointments in the hot table keeps it and its indexes small; read paths go
+through appointments_in_window(), which only queries the archive when the requested window reaches into it.
+
+The archive horizon those reads compare against is kept in the default cache. archive_appointments() clears
+it in its own process; other processes with their own local memory cache see rows archived by the command
+after at most ARCHIVE_HORIZON_CACHE_SECONDS.
+"""
+
+import heapq
+from operator import attrgetter, itemgetter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Appointment, AppointmentArchive
+
+
+ARCHIVED_FIELDS = ['id', 'customer_id', 'date_time', 'time', 'duration', 'status']
+
+ARCHIVE_HORIZON_CACHE_KEY = 'archive-horizon'
+ARCHIVE_HORIZON_CACHE_SECONDS = 5 * 60
+
+
+def archive_horizon():
+
+    """
+    Get the start time of the newest archived appointment, from the cache when possible.
+
+    Parameters:
+        None
+
+    Returns:
+        datetime: The latest archived date_time, or None if nothing has been archived.
+    """
+
+    # Wrapped in a tuple so an empty archive is cached too
+    cached = cache.get(ARCHIVE_HORIZON_CACHE_KEY)
+    if cached is None:
+        cached = (AppointmentArchive.objects.order_by('-date_time').values_list('date_time', flat=True).first(),)
+        cache.set(ARCHIVE_HORIZON_CACHE_KEY, cached, ARCHIVE_HORIZON_CACHE_SECONDS)
+    return cached[0]
+
+
+def archive_appointments(cutoff, batch_size=1000):
+
+    """
+    Move appointments that started before a cutoff into the archive.
+
+    Rows are moved oldest first in batches, with their reminder options; each batch is copied and deleted in
+    its own transaction so a long run never holds a lock for long and can be interrupted safely.
+
+    Parameters:
+        cutoff (datetime): Appointments starting before this time are archived.
+        batch_size (int): Number of appointments moved per transaction.
+
+    Returns:
+        int: The number of appointments archived.
+    """
+
+    archived = 0
+    Through = Appointment.reminder_options.through
+    ArchivedThrough = AppointmentArchive.reminder_options.through
+
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Appointment.objects.filter(date_time__lt=cutoff)
+                .order_by('date_time', 'id')
+                .values_list(*ARCHIVED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+
+            ids = [row[0] for row in rows]
+            AppointmentArchive.objects.bulk_create(
+                [AppointmentArchive(**dict(zip(ARCHIVED_FIELDS, row))) for row in rows]
+            )
+            ArchivedThrough.objects.bulk_create([
+                ArchivedThrough(appointmentarchive_id=appointment_id, reminderoption_id=option_id)
+                for appointment_id, option_id in Through.objects.filter(appointment_id__in=ids).values_list(
+                    'appointment_id', 'reminderoption_id',
+                )
+            ])
+            # A queryset delete skips Appointment.delete(), so archiving is not logged as a cancellation
+            Appointment.objects.filter(id__in=ids).delete()
+
+        cache.delete(ARCHIVE_HORIZON_CACHE_KEY)
+        archived += len(rows)
+
+    return archived
+
+
+def appointments_in_window(start=None, end=None, **filters):
+
+    """
+    Get appointments in a time window from the hot table and, when needed, the archive.
+
+    The archive is only queried when the window starts at or before the newest archived appointment.
+
+    Parameters:
+        start (datetime): Inclusive lower bound on date_time, or None for no lower bound.
+        end (datetime): Exclusive upper bound on date_time, or None for no upper bound.
+        **filters: Extra field lookups applied to both tables (e.g. customer=user).
+
+    Returns:
+        list: Appointment and AppointmentArchive objects ordered by date_time and id.
+    """
+
+    if start is not None:
+        filters['date_time__gte'] = start
+    if end is not None:
+        filters['date_time__lt'] = end
+
+    appointments = list(Appointment.objects.filter(**filters).select_related('customer').order_by('date_time', 'id'))
+
+    horizon = archive_horizon()
+    if horizon is not None and (start is None or start <= horizon):
+        archived = list(AppointmentArchive.objects.filter(**filters).select_related('customer').order_by('date_time', 'id'))
+        # Both lists are already ordered, so this sort is a linear merge
+        appointments = sorted(archived + appointments, key=attrgetter('date_time', 'id'))
+
+    return appointments
+
+
+def stream_appointments(fields, start=None, end=None, chunk_size=2000, **filters):
+
+    """
+    Stream appointment rows in a time window from the hot table and, when needed, the archive.
+
+    Rows are read with iterator() and values_list(), and the two tables are merged in date_time order,
+    so memory use stays constant however many rows match.
+
+    Parameters:
+        fields (list): The fields to read; the first one must be 'date_time'.
+        start (datetime): Inclusive lower bound on date_time, or None for no lower bound.
+        end (datetime): Exclusive upper bound on date_time, or None for no upper bound.
+        chunk_size (int): Number of rows fetched from the database at a time.
+        **filters: Extra field lookups applied to both tables (e.g. customer=user).
+
+    Returns:
+        iterator: Tuples of the requested fields ordered by date_time.
+    """
+
+    if start is not None:
+        filters['date_time__gte'] = start
+    if end is not None:
+        filters['date_time__lt'] = end
+
+    models = [Appointment]
+    horizon = archive_horizon()
+    if horizon is not None and (start is None or start <= horizon):
+        models.append(AppointmentArchive)
+
+    streams = [
+        model.objects.filter(**filters).order_by('date_time', 'id').values_list(*fields).iterator(chunk_size=chunk_size)
+        for model in models
+    ]
+    return heapq.merge(*streams, key=itemgetter(0))
+
+
+
+def appointment_history(customer, before, before_id=None, limit=20):
+
+    """
+    Get a page of a customer's appointments before a keyset position, newest first.
+
+    Pages are addressed by the (date_time, id) of the last row of the previous page rather than by offset, so
+    each page is an indexed range read however deep into the history it is. Both the hot table and the archive
+    are read, since history pages usually reach into the archive.
+
+    Parameters:
+        customer (UserProfile): The customer.
+        before (datetime): Only appointments before this time, or at it with an id below before_id.
+        before_id (int): The id of the last appointment of the previous page, or None.
+        limit (int): The page size.
+
+    Returns:
+        tuple: A list of (id, date_time, status) tuples, and whether there are older appointments.
+    """
+
+    keyset = Q(date_time__lt=before)
+    if before_id is not None:
+        keyset |= Q(date_time=before, id__lt=before_id)
+
+    rows = []
+    for model in (Appointment, AppointmentArchive):
+        rows.extend(
+            model.objects.filter(keyset, customer=customer).order_by('-date_time', '-id')
+            .values_list('id', 'date_time', 'status')[:limit + 1]
+        )
+    rows.sort(key=itemgetter(1, 0), reverse=True)
+    return rows[:limit], len(rows) > limit
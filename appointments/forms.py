@@ -14,6 +14,8 @@ ensuring accurate scheduling of appointments within specified operating hours.
 """
 
 from django import forms
+from django.forms.fields import CallableChoiceIterator
+from django.utils import timezone
 from .models import UserProfile, Appointment, BusinessHours, ReminderOption
 from datetime import datetime
 from django.contrib.auth import get_user_model
@@ -103,7 +105,8 @@ class AppointmentForm(forms.ModelForm):
         fields = ['date_time', 'time', 'reminder_options']
 
     def __init__(self, *args, **kwargs):
-        business_hours = kwargs.pop('business_hours', None)
+        self.business_hours = kwargs.pop('business_hours', None)
+        self.customer = kwargs.pop('customer', None)
         super(AppointmentForm, self).__init__(*args, **kwargs)
         
         # Set initial choices for date_time and time fields
@@ -111,10 +114,55 @@ class AppointmentForm(forms.ModelForm):
             years=range(datetime.now().year, datetime.now().year + 2)
         )
         
-        if business_hours:
-            selected_date = self.initial.get('date_time') or datetime.now().date()
-            available_hours = business_hours.get_available_hours(selected_date)
-            self.fields['time'].widget = forms.Select(choices=[(hour, hour) for hour in available_hours])
+        if self.business_hours:
+            # The available hours are only looked up if the widget is rendered, never on a plain POST
+            self.fields['time'].widget = forms.Select()
+            self.fields['time'].widget.choices = CallableChoiceIterator(self.time_choices)
+
+    def time_choices(self):
+        """
+        Gets the available hours of the initial date as choices, looking them up once per form.
+        """
+
+        if not hasattr(self, '_time_choices'):
+            selected_date = self.initial.get('date_time') or timezone.localdate()
+            if isinstance(selected_date, datetime):
+                selected_date = timezone.localtime(selected_date).date()
+            available_hours = self.business_hours.get_available_hours(selected_date, customer=self.customer)
+            self._time_choices = [(hour, hour) for hour in available_hours]
+        return self._time_choices
+
+    def clean(self):
+        """
+        Combines the date and time into the appointment date_time and checks the slot is bookable.
+        The slot must be in the future, one of the business hours slots of its day and neither booked nor
+        held by another customer; the last check is a single query.
+        """
+
+        cleaned_data = super().clean()
+        selected_date = cleaned_data.get('date_time')
+        selected_time = cleaned_data.get('time')
+        if selected_date is None or selected_time is None:
+            return cleaned_data
+
+        date_time = timezone.make_aware(datetime.combine(selected_date, selected_time))
+        cleaned_data['date_time'] = date_time
+
+        if date_time <= timezone.now():
+            raise forms.ValidationError('Appointments cannot be scheduled in the past.')
+
+        if self.business_hours:
+            # Off-grid times could overlap a booked slot, and late ones would run past closing time
+            if selected_time not in self.business_hours.slot_times()[selected_date.weekday()]:
+                raise forms.ValidationError('Invalid appointment time. Please choose a time within business hours.')
+
+            conflict = self.business_hours.slot_conflict(date_time, customer=self.customer)
+            if conflict == 'booked':
+                raise forms.ValidationError('An appointment already exists at the selected date and time.')
+            if conflict == 'held':
+                raise forms.ValidationError('The selected time is being held by another customer. Please choose another time.')
+
+        return cleaned_data
 
 
 class BusinessHoursForm(forms.ModelForm):
@@ -0,0 +1,168 @@
+"""
+iCalendar Module
+
+
+This module formats appointments as iCalendar (RFC 5545) data. Output is produced line by line from rows read
+with values_list(), so whole calendars can be streamed without building them in memory.
+"""
+
+from datetime import timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+
+PRODUCT_ID = '-//AppointMeNext//Appointments//EN'
+
+# Appointments saved without a duration last one hour, like Appointment.save() assumes
+DEFAULT_DURATION = timedelta(hours=1)
+
+EVENT_STATUS = {
+    'scheduled': 'CONFIRMED',
+    'canceled': 'CANCELLED',
+}
+
+
+def escape_text(value):
+
+    """
+    Escape a value for use in an iCalendar text property.
+
+    Parameters:
+        value (str): The text to escape.
+
+    Returns:
+        str: The escaped text.
+    """
+
+    return (
+        str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+    )
+
+
+def fold_line(line):
+
+    """
+    Fold a content line to the 75 octet limit and terminate it with CRLF.
+
+    Parameters:
+        line (str): The unfolded content line.
+
+    Returns:
+        str: The folded line.
+    """
+
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Never split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        # Continuation lines start with a space that counts towards the limit
+        limit = 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_datetime(value):
+
+    """
+    Format a datetime as an iCalendar UTC date-time.
+
+    Parameters:
+        value (datetime): A timezone-aware datetime.
+
+    Returns:
+        str: The date-time in the form 20240101T090000Z.
+    """
+
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def calendar_header(name):
+
+    """
+    Get the lines opening a calendar.
+
+    Parameters:
+        name (str): The calendar name shown by calendar apps.
+
+    Returns:
+        str: The folded header lines.
+    """
+
+    return ''.join(fold_line(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODUCT_ID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(name)}',
+    ])
+
+
+def calendar_footer():
+
+    """
+    Get the line closing a calendar.
+
+    Returns:
+        str: The folded footer line.
+    """
+
+    return fold_line('END:VCALENDAR')
+
+
+def event(appointment_id, start, duration, status, summary, stamp):
+
+    """
+    Format one appointment as a VEVENT.
+
+    Parameters:
+        appointment_id (int): The ID of the appointment, used for a stable UID.
+        start (datetime): The start of the appointment.
+        duration (timedelta): The length of the appointment, or None for the default hour.
+        status (str): The appointment status.
+        summary (str): The event title.
+        stamp (datetime): The time the calendar was generated.
+
+    Returns:
+        str: The folded VEVENT lines.
+    """
+
+    return ''.join(fold_line(line) for line in [
+        'BEGIN:VEVENT',
+        f'UID:appointment-{appointment_id}@appointmenext',
+        f'DTSTAMP:{format_datetime(stamp)}',
+        f'DTSTART:{format_datetime(start)}',
+        f'DTEND:{format_datetime(start + (duration or DEFAULT_DURATION))}',
+        f'SUMMARY:{escape_text(summary)}',
+        f"STATUS:{EVENT_STATUS.get(status, 'CONFIRMED')}",
+        'END:VEVENT',
+    ])
+
+
+def calendar(name, rows, summary):
+
+    """
+    Stream a calendar of appointments.
+
+    Parameters:
+        name (str): The calendar name.
+        rows (iterable): (date_time, id, duration, status, customer full name) tuples.
+        summary (str): The event title, where {full_name} is replaced by the customer full name.
+
+    Returns:
+        iterator: Chunks of the iCalendar document.
+    """
+
+    stamp = timezone.now()
+    yield calendar_header(name)
+    for date_time, appointment_id, duration, status, full_name in rows:
+        yield event(appointment_id, date_time, duration, status, summary.format(full_name=full_name), stamp)
+    yield calendar_footer()
@@ -0,0 +1,135 @@
+"""
+Idempotency Module
+
+
+This module provides the idempotent view decorator. Clients that may resubmit a POST (e.g. mobile apps on flaky
+networks) send an Idempotency-Key header; the first response for a key is stored and replayed for any retry
+instead of running the view, its validation and its emails again.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def request_fingerprint(request):
+
+    """
+    Compute a fingerprint of a POST request.
+
+    The fingerprint covers the method, the path and the submitted form data, leaving out the CSRF token
+    which changes between otherwise identical submissions.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        str: Hex SHA-256 digest identifying the request.
+    """
+
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.path.encode())
+    for name in sorted(request.POST):
+        if name == 'csrfmiddlewaretoken':
+            continue
+        for value in request.POST.getlist(name):
+            digest.update(b'\0' + name.encode() + b'=' + value.encode())
+    return digest.hexdigest()
+
+
+def stored_response(record):
+
+    """
+    Rebuild the response that was stored for an idempotency key.
+
+    Parameters:
+        record (IdempotencyKey): The stored idempotency key.
+
+    Returns:
+        HttpResponse: A response with the stored status code, redirect location, content type and content.
+    """
+
+    response = HttpResponse(bytes(record.content), content_type=record.content_type or None, status=record.status_code)
+    if record.location:
+        response['Location'] = record.location
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_func):
+
+    """
+    Make a POST view safe to retry with an Idempotency-Key header.
+
+    Requests without the header, non-POST requests and anonymous requests go straight to the view.
+    A retry with a known key is answered from the stored response with a single indexed lookup.
+    Reusing a key for a different request is rejected with 422, and a retry that arrives while the
+    first request is still running gets 409, unless that request has stored nothing for
+    IDEMPOTENCY_PENDING_TIMEOUT_SECONDS, in which case its worker is taken to have died and the retry runs.
+    Server errors and exceptions are not stored so the client can retry them.
+
+    Parameters:
+        view_func (callable): The view to wrap.
+
+    Returns:
+        callable: The wrapped view.
+    """
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if request.method != 'POST' or not key or not request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return JsonResponse({'error': f'{IDEMPOTENCY_HEADER} is too long'}, status=400)
+
+        fingerprint = request_fingerprint(request)
+        record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+
+        if record is not None and record.is_expired():
+            record.delete()
+            record = None
+
+        if record is not None:
+            if record.fingerprint != fingerprint:
+                return JsonResponse({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'}, status=422)
+            if record.status_code is not None:
+                return stored_response(record)
+            if not record.take_over():
+                return JsonResponse({'error': 'A request with this key is still being processed'}, status=409)
+        else:
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(user=request.user, key=key, fingerprint=fingerprint)
+            except IntegrityError:
+                # A concurrent retry claimed the key first
+                return JsonResponse({'error': 'A request with this key is still being processed'}, status=409)
+
+        try:
+            response = view_func(request, *args, **kwargs)
+        except BaseException:
+            # Including SystemExit from a worker timeout, so the key does not stay pending
+            record.delete()
+            raise
+
+        if response.status_code >= 500 or response.streaming:
+            record.delete()
+        else:
+            record.status_code = response.status_code
+            record.location = response.get('Location', '')
+            record.content_type = response.get('Content-Type', '')
+            record.content = response.content
+            record.save(update_fields=['status_code', 'location', 'content_type', 'content'])
+
+        return response
+
+    return _wrapped_view
@@ -0,0 +1,132 @@
+"""
+Log Module
+
+
+This module contains the logging pieces configured in settings.LOGGING.
+
+install_queue_logging(), called when the app is ready, moves the handlers of the configured loggers behind a
+DeferredQueueHandler, so a request thread only puts records on a queue and a QueueListener thread does the
+formatting and the file and console I/O. SamplingFilter keeps a share of the low level records of a busy logger,
+StructuredFormatter appends the fields passed with extra= to the message, and SettingFileHandler writes to a
+file named by a setting.
+"""
+
+import atexit
+import copy
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from django.conf import settings
+
+
+# Attributes every LogRecord has; anything else on a record was passed with extra=
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_listeners = []
+_installed = False
+
+
+class SamplingFilter(logging.Filter):
+
+    """
+    Keep a random share of the records at or below a level, and all records above it.
+    """
+
+    def __init__(self, rate=1.0, max_level='INFO'):
+        super().__init__()
+        self.rate = rate
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+
+    def filter(self, record):
+        return record.levelno > self.max_level or random.random() < self.rate
+
+
+class StructuredFormatter(logging.Formatter):
+
+    """
+    Format a record and append its extra fields as key=value pairs.
+    """
+
+    def format(self, record):
+        message = super().format(record)
+        fields = ' '.join(
+            f'{key}={value!r}' for key, value in vars(record).items()
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_')
+        )
+        return f'{message} {fields}' if fields else message
+
+
+class DeferredQueueHandler(QueueHandler):
+
+    """
+    Queue handler that leaves all formatting to the listener thread.
+
+    QueueHandler.prepare() formats the message and the traceback on the logging thread so the record can be
+    pickled. The queues here never leave the process, so the record is queued with its msg and args as they are.
+    """
+
+    def prepare(self, record):
+        # A copy, so the listener's handlers do not set message and exc_text on a record other handlers still see
+        return copy.copy(record)
+
+
+class SettingFileHandler(RotatingFileHandler):
+
+    """
+    Rotating file handler that writes to the path held by a setting.
+
+    The file is only opened with the first record, and the path is read and its directory created then, so
+    loading the settings has no side effects and tests can point the setting elsewhere.
+    """
+
+    def __init__(self, setting, **kwargs):
+        self.setting = setting
+        super().__init__(getattr(settings, setting), delay=True, **kwargs)
+
+    def _open(self):
+        self.baseFilename = os.path.abspath(getattr(settings, self.setting))
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+def install_queue_logging():
+
+    """
+    Move the handlers of the loggers in settings.LOGGING behind one queue each, served by a listener thread.
+
+    Loggers without handlers are left alone, and calling this again does nothing.
+    """
+
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    for name in getattr(settings, 'LOGGING', {}).get('loggers', {}):
+        logger = logging.getLogger(name)
+        handlers = [handler for handler in logger.handlers if not isinstance(handler, QueueHandler)]
+        if not handlers:
+            continue
+
+        records = queue.SimpleQueue()
+        listener = QueueListener(records, *handlers, respect_handler_level=True)
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(DeferredQueueHandler(records))
+        listener.start()
+        _listeners.append(listener)
+
+    atexit.register(stop_queue_logging)
+
+
+def stop_queue_logging():
+
+    """
+    Write out the queued records and stop the listener threads.
+    """
+
+    while _listeners:
+        _listeners.pop().stop()
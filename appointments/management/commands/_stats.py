@@ -0,0 +1,32 @@
+"""
+Latency statistics shared by the benchmarking commands.
+"""
+
+import math
+
+
+def percentile(sorted_values, pct):
+    """
+    Returns the pct-th percentile of already sorted values, using the nearest-rank method.
+    """
+
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def summarize(seconds):
+    """
+    Returns the count, mean and p50/p95/p99/max latencies in milliseconds of a list of durations in seconds.
+    """
+
+    values = sorted(value * 1000 for value in seconds)
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values), 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 50), 3),
+        'p95_ms': round(percentile(values, 95), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+        'max_ms': round(values[-1], 3) if values else 0.0,
+    }
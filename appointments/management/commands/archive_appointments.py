@@ -0,0 +1,39 @@
+"""
+Management command that moves old appointments into the archive table.
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointments.archive import archive_appointments
+
+
+class Command(BaseCommand):
+    help = 'Moves appointments older than the given number of days from Appointment into AppointmentArchive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            required=True,
+            metavar='DAYS',
+            help='Archive appointments that started more than this many days ago.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of appointments moved per transaction (default: 1000).',
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0:
+            raise CommandError('--older-than must not be negative.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        archived = archive_appointments(cutoff, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} appointment(s) older than {cutoff:%Y-%m-%d %H:%M}.'))
@@ -0,0 +1,158 @@
+"""
+Management command that benchmarks the booking hot paths.
+
+A throwaway test database is created and seeded with synthetic customers and appointments, then each hot
+path is requested through the test client. Latency percentiles and SQL query counts are printed and can be
+written as JSON, so runs on different commits can be compared.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments import synthetic
+from appointments.models import Appointment, UserProfile
+
+from ._stats import summarize
+
+
+OPEN_HOUR = synthetic.OPEN_HOUR
+SLOTS_PER_DAY = synthetic.SLOTS_PER_DAY
+
+
+class Command(BaseCommand):
+    help = 'Seeds a test database and reports latency percentiles and query counts of the booking hot paths.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=200, help='Number of customers to seed (default: 200).')
+        parser.add_argument('--appointments', type=int, default=5000, help='Number of appointments to seed (default: 5000).')
+        parser.add_argument('--iterations', type=int, default=50, help='Requests timed per hot path (default: 50).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data (default: 0).')
+        parser.add_argument('--output', help='Write the results as JSON to this file ("-" for stdout).')
+
+    def handle(self, *args, **options):
+        if options['customers'] < 1 or options['iterations'] < 1 or options['appointments'] < 0:
+            raise CommandError('--customers and --iterations must be at least 1, --appointments not negative.')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            seeded = self.seed(options)
+            results = self.run_scenarios(seeded, options['iterations'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'config': {key: options[key] for key in ('customers', 'appointments', 'iterations', 'seed')},
+            'results': results,
+        }
+        self.print_table(results)
+
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        elif options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+    def seed(self, options):
+        """
+        Creates the owner, business hours, customers and appointments, and returns what the scenarios need.
+        """
+
+        generated = synthetic.generate(options['customers'], options['appointments'], seed=options['seed'])
+        owner = UserProfile.objects.create(username='bench-owner', password=make_password(None), user_type='owner')
+        today = timezone.localdate()
+
+        return {
+            'owner': owner,
+            'customer': UserProfile.objects.get(pk=generated['customer_ids'][0]),
+            'busy_day': today + timedelta(days=1),
+            # Bookings made by the benchmark go after the seeded range so they never collide
+            'free_day': generated['first_day'] + timedelta(days=generated['span_days'] + 1),
+        }
+
+    def run_scenarios(self, seeded, iterations):
+        """
+        Times every hot path and returns the latency and query count summary of each.
+        """
+
+        customer_client = Client()
+        customer_client.force_login(seeded['customer'])
+        owner_client = Client()
+        owner_client.force_login(seeded['owner'])
+
+        booking_slots = [
+            seeded['free_day'] + timedelta(days=i // SLOTS_PER_DAY) for i in range(iterations)
+        ]
+
+        def book(i):
+            day = booking_slots[i]
+            return customer_client.post(reverse('dashboard'), {
+                'date_time_year': day.year, 'date_time_month': day.month, 'date_time_day': day.day,
+                'time': f'{OPEN_HOUR + i % SLOTS_PER_DAY:02d}:00',
+            })
+
+        booked_ids = []
+
+        def find_booked():
+            free_from = timezone.make_aware(datetime.combine(seeded['free_day'], datetime.min.time()))
+            booked_ids.extend(Appointment.objects.filter(date_time__gte=free_from).order_by('date_time').values_list('id', flat=True))
+
+        def cancel(i):
+            return customer_client.post(reverse('cancel_appointment', args=[booked_ids[i]]))
+
+        # (name, prepare, request, expected status); without an expected status any status below 400 will do
+        scenarios = [
+            ('get_available_hours', None, lambda i: customer_client.get(
+                reverse('get_available_hours'), {'selected_date': seeded['busy_day'].isoformat()},
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            ), None),
+            ('dashboard GET', None, lambda i: customer_client.get(reverse('dashboard')), None),
+            # A rejected booking re-renders the form with 200, so only the redirect counts as booked
+            ('dashboard POST', None, book, 302),
+            ('owner_dashboard', None, lambda i: owner_client.get(reverse('owner_dashboard')), None),
+            ('get_appointments', None, lambda i: owner_client.get(reverse('get_appointments')), None),
+            # Cancels the appointments booked by the dashboard POST scenario
+            ('cancel_appointment', find_booked, cancel, 302),
+        ]
+
+        results = {}
+        for name, prepare, request, expected in scenarios:
+            if prepare is not None:
+                prepare()
+            timings = []
+            queries = []
+            for i in range(iterations):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = request(i)
+                    timings.append(time.perf_counter() - started)
+                if response.status_code >= 400 or expected not in (None, response.status_code):
+                    raise CommandError(f'{name} returned {response.status_code}' + (f', expected {expected}' if expected else ''))
+                queries.append(len(captured))
+
+            results[name] = summarize(timings)
+            results[name]['queries_median'] = sorted(queries)[len(queries) // 2]
+            results[name]['queries_max'] = max(queries)
+
+        return results
+
+    def print_table(self, results):
+        """
+        Prints the results as a table.
+        """
+
+        self.stdout.write(f"{'hot path':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<22}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['queries_median']:>10}"
+            )
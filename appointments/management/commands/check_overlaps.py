@@ -0,0 +1,86 @@
+"""
+Management command that reports overlapping scheduled appointments.
+
+Appointments are streamed from the database ordered by start time and checked in a single sweep-line pass:
+a min-heap keeps the end times of the appointments still in progress, so memory stays bounded by the number
+of appointments running at the same moment rather than by the size of the table.
+"""
+
+import heapq
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from appointments.models import Appointment
+
+
+# Appointments saved without a duration last one hour, like Appointment.save() assumes
+DEFAULT_DURATION = timedelta(hours=1)
+
+
+class Command(BaseCommand):
+    help = 'Reports scheduled appointments that overlap an earlier one, optionally canceling the later duplicate.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cancel',
+            action='store_true',
+            help='Cancel every appointment that overlaps an earlier one.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of rows fetched from the database at a time (default: 2000).',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        cancel = options['cancel']
+
+        rows = (
+            Appointment.objects.filter(status='scheduled')
+            .order_by('date_time', 'id')
+            .values_list('id', 'date_time', 'duration')
+            .iterator(chunk_size=chunk_size)
+        )
+
+        # (end, id, start) of the appointments still in progress at the current sweep position
+        active = []
+        to_cancel = []
+        checked = overlaps = canceled = 0
+
+        for appointment_id, start, duration in rows:
+            checked += 1
+            end = start + (duration or DEFAULT_DURATION)
+
+            while active and active[0][0] <= start:
+                heapq.heappop(active)
+
+            if active:
+                overlaps += 1
+                # Report the earlier appointment that runs the longest past this start
+                other_end, other_id, other_start = max(active)
+                kind = 'duplicates' if other_start == start else 'overlaps'
+                self.stdout.write(
+                    f'Appointment {appointment_id} at {start:%Y-%m-%d %H:%M} {kind} '
+                    f'appointment {other_id} at {other_start:%Y-%m-%d %H:%M}'
+                )
+
+                if cancel:
+                    # A canceled appointment no longer blocks the ones after it
+                    to_cancel.append(appointment_id)
+                    if len(to_cancel) >= chunk_size:
+                        canceled += Appointment.objects.filter(id__in=to_cancel).cancel()
+                        to_cancel = []
+                    continue
+
+            heapq.heappush(active, (end, appointment_id, start))
+
+        if to_cancel:
+            canceled += Appointment.objects.filter(id__in=to_cancel).cancel()
+
+        summary = f'Checked {checked} appointment(s), found {overlaps} overlap(s).'
+        if cancel:
+            summary += f' Canceled {canceled} appointment(s).'
+        self.stdout.write(self.style.SUCCESS(summary) if not overlaps else self.style.WARNING(summary))
@@ -0,0 +1,17 @@
+"""
+Management command that deletes expired slot holds.
+
+Meant to be run periodically (e.g. from cron) so abandoned holds do not pile up in the table.
+"""
+
+from django.core.management.base import BaseCommand
+
+from appointments.models import SlotHold
+
+
+class Command(BaseCommand):
+    help = 'Deletes slot holds whose expiry time has passed.'
+
+    def handle(self, *args, **options):
+        deleted = SlotHold.objects.expire_stale()
+        self.stdout.write(self.style.SUCCESS(f'Expired {deleted} slot hold(s).'))
@@ -0,0 +1,273 @@
+"""
+Management command that imports appointments from a CSV file.
+
+The file is read in chunks. Each chunk resolves its customers with one query, checks slot conflicts in memory
+against the appointments already booked in the chunk's time range, and inserts the valid rows in bulk,
+logging them in the change feed in the same transaction. If a slot is booked between the check and the
+insert, so the bulk insert hits the unique_scheduled_slot constraint, that chunk is inserted row by row.
+Rows that cannot be imported are written to a rejects file together with the reason.
+
+The CSV needs a header with either a 'username' or 'customer' column, and either a 'date_time' column
+(ISO 8601) or 'date' and 'time' columns, the format produced by the CSV export. Optional 'status' and
+'duration_minutes' columns are honoured. Times without an offset are in the project's TIME_ZONE.
+
+Importing 100k rows into a file-backed SQLite database measures 40k-45k rows/s (up to about 48k with
+--chunk-size 20000), which is short of the 50k rows/s target. The time is split between the inserts, which
+also maintain the unique_scheduled_slot index, the change log copy, and parsing each row in Python.
+"""
+
+import csv
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from appointments.models import Appointment, AppointmentChange, UserProfile, bump_schedule_version
+
+
+DEFAULT_DURATION = timedelta(hours=1)
+STATUSES = {status for status, _ in Appointment.STATUS_CHOICES}
+
+
+class Command(BaseCommand):
+    help = 'Imports appointments from a CSV file, writing rows that cannot be imported to a rejects file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import.')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of rows processed per transaction (default: 5000).',
+        )
+        parser.add_argument(
+            '--rejects',
+            help='Where to write rejected rows (default: <path>.rejects.csv).',
+        )
+
+    def handle(self, *args, **options):
+        self.tz = ZoneInfo(settings.TIME_ZONE)
+        self.customers = {}
+        # Scheduled slots taken by rows imported so far
+        self.imported_slots = set()
+        chunk_size = max(options['chunk_size'], 1)
+        rejects_path = options['rejects'] or f"{options['path']}.rejects.csv"
+
+        imported = rejected = 0
+        started = datetime.now()
+
+        with open(options['path'], newline='', encoding='utf-8') as source, \
+                open(rejects_path, 'w', newline='', encoding='utf-8') as rejects_file:
+            reader = csv.reader(source)
+            fields = next(reader, [])
+            self.columns = {name.strip(): index for index, name in enumerate(fields)}
+            if not ({'username', 'customer'} & self.columns.keys()) or not ('date_time' in self.columns or {'date', 'time'} <= self.columns.keys()):
+                raise CommandError('The CSV needs a username (or customer) column and a date_time (or date and time) column.')
+
+            rejects = csv.writer(rejects_file)
+            rejects.writerow(fields + ['reason'])
+
+            while True:
+                chunk = list(islice(reader, chunk_size))
+                if not chunk:
+                    break
+                chunk_imported, chunk_rejects = self.import_chunk(chunk)
+                imported += chunk_imported
+                rejected += len(chunk_rejects)
+                rejects.writerows(row + [reason] for row, reason in chunk_rejects)
+
+        elapsed = (datetime.now() - started).total_seconds()
+        rate = (imported + rejected) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} appointment(s), rejected {rejected} ({rate:.0f} rows/s). Rejects written to {rejects_path}.'
+        ))
+
+    def column(self, row, name):
+        """
+        Returns the stripped value of the named column in a CSV row, or '' if the row does not have it.
+        """
+
+        index = self.columns.get(name)
+        if index is None or index >= len(row):
+            return ''
+        return row[index].strip()
+
+    def parse_row(self, row):
+        """
+        Returns (username, date_time, local time, status, duration) for a CSV row, or raises ValueError with the reason.
+        """
+
+        username = self.column(row, 'username') or self.column(row, 'customer')
+        if not username:
+            raise ValueError('missing username')
+
+        value = self.column(row, 'date_time') or f"{self.column(row, 'date')}T{self.column(row, 'time')}"
+        try:
+            date_time = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f'invalid date/time {value!r}')
+        if date_time.tzinfo is None:
+            time = date_time.time()
+            date_time = date_time.replace(tzinfo=self.tz)
+        else:
+            time = date_time.astimezone(self.tz).time()
+        # Aware datetimes sharing a tzinfo compare by wall time, so local times skipped by DST would look free
+        date_time = date_time.astimezone(dt_timezone.utc)
+
+        status = self.column(row, 'status') or 'scheduled'
+        if status not in STATUSES:
+            raise ValueError(f'invalid status {status!r}')
+
+        duration = DEFAULT_DURATION
+        minutes = self.column(row, 'duration_minutes')
+        if minutes:
+            try:
+                duration = timedelta(minutes=int(minutes))
+            except ValueError:
+                raise ValueError(f'invalid duration {minutes!r}')
+
+        return username, date_time, time, status, duration
+
+    def import_chunk(self, chunk):
+        """
+        Imports one chunk of CSV rows and returns the number imported and the (row, reason) rejects.
+        """
+
+        rejects = []
+        parsed = []
+        for row in chunk:
+            try:
+                parsed.append((row, self.parse_row(row)))
+            except ValueError as exc:
+                rejects.append((row, str(exc)))
+
+        if not parsed:
+            return 0, rejects
+
+        # One lookup for the customers this chunk needs that earlier chunks did not
+        missing = {fields[0] for _, fields in parsed} - self.customers.keys()
+        if missing:
+            self.customers.update(UserProfile.objects.filter(username__in=missing).values_list('username', 'id'))
+
+        date_times = [fields[1] for _, fields in parsed]
+        booked = set(
+            Appointment.objects.filter(
+                date_time__range=(min(date_times), max(date_times)), status='scheduled'
+            ).values_list('date_time', flat=True)
+        )
+
+        rows = []
+        for row, (username, date_time, time, status, duration) in parsed:
+            customer_id = self.customers.get(username)
+            if customer_id is None:
+                rejects.append((row, f'unknown customer {username!r}'))
+                continue
+            if status == 'scheduled':
+                if date_time in booked or date_time in self.imported_slots:
+                    rejects.append((row, 'slot already booked'))
+                    continue
+                self.imported_slots.add(date_time)
+            rows.append((row, (customer_id, date_time, time, duration, status)))
+
+        if not rows:
+            return 0, rejects
+
+        try:
+            with transaction.atomic():
+                # Taking the write lock first keeps other writers out until the chunk is committed
+                bump_schedule_version({values[0] for _, values in rows})
+                self.insert([values for _, values in rows])
+            return len(rows), rejects
+        except IntegrityError:
+            pass
+
+        # A slot was booked after the check above, by a live booking or another import
+        imported = 0
+        with transaction.atomic():
+            bump_schedule_version({values[0] for _, values in rows})
+            for row, values in rows:
+                try:
+                    with transaction.atomic():
+                        self.insert([values])
+                except IntegrityError:
+                    self.imported_slots.discard(values[1])
+                    rejects.append((row, 'slot already booked'))
+                else:
+                    imported += 1
+
+        return imported, rejects
+
+    def insert(self, rows):
+        """
+        Inserts appointments and their change log entries with the fastest method for the database.
+        """
+
+        if connection.vendor == 'sqlite':
+            self.insert_sqlite(rows)
+        else:
+            self.insert_orm(rows)
+
+    def insert_orm(self, rows):
+        """
+        Inserts appointments and their change log entries with bulk_create().
+        """
+
+        appointments = Appointment.objects.bulk_create([
+            Appointment(customer_id=customer_id, date_time=date_time, time=time, duration=duration, status=status)
+            for customer_id, date_time, time, duration, status in rows
+        ])
+        AppointmentChange.objects.bulk_create([
+            AppointmentChange(
+                appointment_id=appointment.pk,
+                customer_id=appointment.customer_id,
+                action='create',
+                date_time=appointment.date_time,
+                status=appointment.status,
+            )
+            for appointment in appointments
+        ])
+
+    def insert_sqlite(self, rows):
+        """
+        Inserts appointments, whose date_time is in UTC, with executemany() on values adapted once per row, and
+        copies them into the change log with a single INSERT ... SELECT. SQLite allows one writer at a time and
+        this transaction already holds the write lock, so the rows after the previous maximum id are exactly this
+        chunk.
+        """
+
+        duration_field = Appointment._meta.get_field('duration')
+        durations = {}
+        params = []
+        for customer_id, date_time, time, duration, status in rows:
+            if duration not in durations:
+                durations[duration] = duration_field.get_db_prep_value(duration, connection)
+            # str() of naive UTC datetimes and of times is how the SQLite backend stores them
+            params.append((
+                customer_id,
+                str(date_time.replace(tzinfo=None)),
+                str(time),
+                durations[duration],
+                status,
+            ))
+
+        appointment_table = Appointment._meta.db_table
+        change_table = AppointmentChange._meta.db_table
+        changed_at = str(timezone.now().replace(tzinfo=None))
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {appointment_table}')
+            last_id = cursor.fetchone()[0]
+            cursor.executemany(
+                f'INSERT INTO {appointment_table} (customer_id, date_time, time, duration, status) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                params,
+            )
+            cursor.execute(
+                f'INSERT INTO {change_table} (appointment_id, customer_id, action, date_time, status, changed_at) '
+                f"SELECT id, customer_id, 'create', date_time, status, %s FROM {appointment_table} WHERE id > %s ORDER BY id",
+                [changed_at, last_id],
+            )
@@ -0,0 +1,16 @@
+"""
+Management command that prints a token for profiling requests.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from appointments.profiling import PROFILE_HEADER, make_profile_token
+
+
+class Command(BaseCommand):
+    help = 'Prints a signed token that enables profiling for requests carrying it in the X-Profile header.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_profile_token())
+        self.stderr.write(f'Send it as the {PROFILE_HEADER} header; it expires in {settings.PROFILE_TOKEN_MAX_AGE} seconds.')
@@ -0,0 +1,17 @@
+"""
+Management command that deletes expired idempotency keys.
+
+Meant to be run periodically (e.g. from cron) so the table only holds keys that can still be replayed.
+"""
+
+from django.core.management.base import BaseCommand
+
+from appointments.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Deletes idempotency keys older than IDEMPOTENCY_KEY_TTL_SECONDS.'
+
+    def handle(self, *args, **options):
+        deleted = IdempotencyKey.objects.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted} idempotency key(s).'))
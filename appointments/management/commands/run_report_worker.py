@@ -0,0 +1,82 @@
+"""
+Management command that renders queued PDF reports.
+
+Queued ReportJob rows are claimed one at a time and rendered in a process pool, so rendering never blocks a web
+worker and several reports can be drawn in parallel.
+"""
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import django
+from django.core.management.base import BaseCommand
+
+from appointments.models import ReportJob
+from appointments.reports import render_report
+
+
+class Command(BaseCommand):
+    help = 'Renders queued PDF report jobs in a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Number of worker processes (default: 2).',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between checks for new jobs when the queue is empty (default: 5).',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for new jobs.',
+        )
+
+    def claim_next_job(self):
+        """
+        Marks the oldest queued job as running and returns its id, or None if the queue is empty.
+        """
+
+        for job_id in ReportJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)[:5]:
+            # Another worker may claim the same job first, only one update can win
+            if ReportJob.objects.filter(pk=job_id, status='queued').update(status='running'):
+                return job_id
+        return None
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+
+        # Spawned workers open their own database connections instead of inheriting this process's
+        context = multiprocessing.get_context('spawn')
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            running = {}
+
+            while True:
+                while len(running) < workers:
+                    job_id = self.claim_next_job()
+                    if job_id is None:
+                        break
+                    running[pool.submit(render_report, job_id)] = job_id
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as exc:
+                        ReportJob.objects.filter(pk=job_id).update(status='failed', error=str(exc))
+                        status = 'failed'
+                    self.stdout.write(f'Report job {job_id}: {status}')
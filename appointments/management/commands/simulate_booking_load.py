@@ -0,0 +1,256 @@
+"""
+Management command that simulates a rush of customers booking the same popular slots.
+
+A file-backed SQLite test database is created and seeded with customers, each with a logged in session. Every
+customer then posts a booking for one of a few popular slots through the dashboard view, and some of the
+successful bookings are canceled again. The rush runs once from a thread pool and once from a process pool,
+and for each the throughput, outcome counts, "database is locked" errors, double bookings and latency
+percentiles are reported.
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments import synthetic
+from appointments.models import Appointment, AppointmentChange, UserProfile
+
+from ._stats import summarize
+
+
+def use_database(database_name):
+    """
+    Points a spawned worker process at the simulation database the first time it runs a customer.
+    """
+
+    if settings.DATABASES['default']['NAME'] != database_name:
+        setup_test_environment()
+        settings.DATABASES['default']['NAME'] = database_name
+
+
+def warm_up(delay):
+    """
+    Keeps a worker busy for a moment so the pool starts all of its processes before the rush.
+    """
+
+    time.sleep(delay)
+
+
+def book_and_cancel(database_name, customer_id, session_key, slot, cancel):
+    """
+    Books slot, an ISO datetime, as the customer logged in with session_key and optionally cancels it again.
+
+    Returns the outcome and latency of the booking, and of the cancellation if one was made.
+    """
+
+    use_database(database_name)
+    client = Client()
+    client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+    local = timezone.localtime(datetime.fromisoformat(slot))
+    result = {'book': None, 'book_seconds': 0.0, 'cancel': None, 'cancel_seconds': 0.0}
+
+    try:
+        started = time.perf_counter()
+        try:
+            response = client.post(reverse('dashboard'), {
+                'date_time_year': local.year, 'date_time_month': local.month, 'date_time_day': local.day,
+                'time': local.strftime('%H:%M'),
+            })
+            result['book'] = 'booked' if response.status_code == 302 else 'rejected'
+        except OperationalError as error:
+            result['book'] = 'locked' if 'database is locked' in str(error) else 'error'
+        except Exception:
+            result['book'] = 'error'
+        result['book_seconds'] = time.perf_counter() - started
+
+        if result['book'] == 'booked' and cancel:
+            appointment_id = Appointment.objects.filter(
+                customer_id=customer_id, date_time=datetime.fromisoformat(slot),
+            ).values_list('id', flat=True).first()
+            started = time.perf_counter()
+            try:
+                response = client.post(reverse('cancel_appointment', args=[appointment_id]))
+                result['cancel'] = 'canceled' if response.status_code == 302 else 'rejected'
+            except OperationalError as error:
+                result['cancel'] = 'locked' if 'database is locked' in str(error) else 'error'
+            except Exception:
+                result['cancel'] = 'error'
+            result['cancel_seconds'] = time.perf_counter() - started
+    finally:
+        # Like a web worker with CONN_MAX_AGE = 0, every customer gets a fresh connection
+        connections.close_all()
+
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Simulates many customers booking the same popular slots at once and reports how the booking path holds up.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=200, help='Number of customers in the rush (default: 200).')
+        parser.add_argument('--slots', type=int, default=3, help='Number of popular slots they compete for (default: 3).')
+        parser.add_argument('--threads', type=int, default=16, help='Size of the thread pool (default: 16).')
+        parser.add_argument('--processes', type=int, default=4, help='Size of the process pool (default: 4).')
+        parser.add_argument(
+            '--mode', choices=['threads', 'processes', 'both'], default='both',
+            help='Which pools to run the rush from (default: both).',
+        )
+        parser.add_argument(
+            '--cancel-rate', type=float, default=0.2,
+            help='Share of successful bookings that are canceled again (default: 0.2).',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0).')
+        parser.add_argument('--output', help='Write the results as JSON to this file ("-" for stdout).')
+
+    def handle(self, *args, **options):
+        if options['customers'] < 1 or options['slots'] < 1 or options['threads'] < 1 or options['processes'] < 1:
+            raise CommandError('--customers, --slots, --threads and --processes must be at least 1.')
+        if connection.vendor != 'sqlite':
+            raise CommandError('The load simulation runs against a SQLite database file.')
+
+        # A file, not the in-memory test database, so that separate processes see the same data
+        handle, database_name = tempfile.mkstemp(prefix='booking-load-', suffix='.sqlite3')
+        os.close(handle)
+        connection.settings_dict['TEST']['NAME'] = database_name
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            plan, slots = self.prepare(options)
+            connection.close()
+
+            results = {}
+            if options['mode'] in ('threads', 'both'):
+                with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                    results['threads'] = self.rush(pool, database_name, plan, slots)
+            if options['mode'] in ('processes', 'both'):
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(
+                    max_workers=options['processes'], mp_context=context,
+                    initializer=django.setup,
+                ) as pool:
+                    list(pool.map(warm_up, [0.5] * options['processes']))
+                    results['processes'] = self.rush(pool, database_name, plan, slots)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'config': {key: options[key] for key in ('customers', 'slots', 'threads', 'processes', 'cancel_rate', 'seed')},
+            'results': results,
+        }
+        self.print_table(results)
+
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        elif options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+    def prepare(self, options):
+        """
+        Seeds the customers, logs each of them in, and returns the rush plan and the popular slots.
+        """
+
+        rng = random.Random(options['seed'])
+        synthetic.ensure_business_hours()
+        customer_ids = synthetic.create_customers(options['customers'], rng)
+
+        # Popular slots start tomorrow morning and fill whole days before moving to the next
+        tomorrow = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time()))
+        slots = [
+            (tomorrow + timedelta(days=i // synthetic.SLOTS_PER_DAY, hours=synthetic.OPEN_HOUR + i % synthetic.SLOTS_PER_DAY)).isoformat()
+            for i in range(options['slots'])
+        ]
+
+        plan = []
+        for customer in UserProfile.objects.filter(pk__in=customer_ids).order_by('pk'):
+            client = Client()
+            client.force_login(customer)
+            session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+            plan.append((customer.pk, session_key, rng.choice(slots), rng.random() < options['cancel_rate']))
+
+        return plan, slots
+
+    def rush(self, pool, database_name, plan, slots):
+        """
+        Runs the plan on the pool, then clears its bookings and returns the summary.
+        """
+
+        last_change_id = AppointmentChange.objects.values_list('id', flat=True).last() or 0
+        connection.close()
+
+        started = time.perf_counter()
+        results = list(pool.map(book_and_cancel, [database_name] * len(plan), *zip(*plan)))
+        elapsed = time.perf_counter() - started
+
+        double_bookings = count_double_bookings(last_change_id)
+        Appointment.objects.filter(date_time__in=[datetime.fromisoformat(slot) for slot in slots]).delete()
+        connection.close()
+
+        cancels = [result for result in results if result['cancel']]
+        outcomes = Counter(f"book {result['book']}" for result in results)
+        outcomes.update(f"cancel {result['cancel']}" for result in cancels)
+        return {
+            'requests': len(results) + len(cancels),
+            'seconds': round(elapsed, 3),
+            'requests_per_second': round((len(results) + len(cancels)) / elapsed, 1),
+            'outcomes': dict(sorted(outcomes.items())),
+            'locked_errors': sum(count for outcome, count in outcomes.items() if outcome.endswith('locked')),
+            'double_bookings': double_bookings,
+            'book': summarize([result['book_seconds'] for result in results]),
+            'cancel': summarize([result['cancel_seconds'] for result in cancels]),
+        }
+
+    def print_table(self, results):
+        """
+        Prints the results as a table.
+        """
+
+        for pool, result in results.items():
+            self.stdout.write(
+                f"{pool}: {result['requests']} requests in {result['seconds']:.2f}s "
+                f"({result['requests_per_second']:.1f}/s), {result['locked_errors']} database is locked error(s), "
+                f"{result['double_bookings']} double booking(s)"
+            )
+            self.stdout.write('  ' + ', '.join(f'{outcome}: {count}' for outcome, count in result['outcomes'].items()))
+            self.stdout.write(f"  {'':<8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+            for name in ('book', 'cancel'):
+                summary = result[name]
+                self.stdout.write(
+                    f"  {name:<8}{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}{summary['p99_ms']:>10.2f}{summary['max_ms']:>10.2f}"
+                )
+
+
+def count_double_bookings(after_change_id):
+    """
+    Replays the change log after after_change_id and counts the bookings that were made while the slot
+    already had a live appointment.
+    """
+
+    live = defaultdict(int)
+    double_bookings = 0
+    changes = AppointmentChange.objects.filter(id__gt=after_change_id).order_by('id').values_list('action', 'date_time')
+    for action, date_time in changes:
+        if action == 'create':
+            if live[date_time]:
+                double_bookings += 1
+            live[date_time] += 1
+        elif action == 'cancel':
+            live[date_time] -= 1
+    return double_bookings
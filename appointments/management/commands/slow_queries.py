@@ -0,0 +1,72 @@
+"""
+Management command that summarizes the slow query log.
+
+Entries from the log and its rotated backups are grouped by SQL fingerprint, so one slow ORM call made from many
+requests shows up as a single line with its count, total time, latency percentiles and call sites.
+"""
+
+import glob
+import json
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ._stats import percentile
+
+
+class Command(BaseCommand):
+    help = 'Groups the slow query log by normalized SQL and shows the most expensive queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Slow query log to read (default: settings.SLOW_QUERY_LOG).')
+        parser.add_argument('--limit', type=int, default=20, help='Number of fingerprints to show (default: 20).')
+        parser.add_argument(
+            '--sort', choices=['total', 'count', 'max', 'p95'], default='total',
+            help='Order fingerprints by total time, count, maximum or p95 duration (default: total).',
+        )
+
+    def handle(self, *args, **options):
+        path = str(options['path'] or settings.SLOW_QUERY_LOG)
+        paths = sorted(glob.glob(glob.escape(path) + '.*'), reverse=True) + glob.glob(glob.escape(path))
+        if not paths:
+            raise CommandError(f'No slow query log found at {path}.')
+
+        groups = defaultdict(lambda: {'durations': [], 'call_sites': Counter(), 'sql': ''})
+        skipped = 0
+        for log_path in paths:
+            with open(log_path) as log:
+                for line in log:
+                    try:
+                        entry = json.loads(line)
+                        group = groups[entry['fingerprint']]
+                        group['durations'].append(entry['duration_ms'])
+                    except (ValueError, KeyError):
+                        skipped += 1
+                        continue
+                    group['sql'] = entry.get('sql', '')
+                    group['call_sites'][entry.get('call_site') or '?'] += 1
+
+        summary = []
+        for key, group in groups.items():
+            durations = sorted(group['durations'])
+            summary.append({
+                'fingerprint': key,
+                'count': len(durations),
+                'total': sum(durations),
+                'max': durations[-1],
+                'p95': percentile(durations, 95),
+                'sql': group['sql'],
+                'call_sites': group['call_sites'].most_common(3),
+            })
+        summary.sort(key=lambda row: row[options['sort']], reverse=True)
+
+        self.stdout.write(f"{'fingerprint':<14}{'count':>8}{'total ms':>12}{'p95 ms':>10}{'max ms':>10}")
+        for row in summary[:options['limit']]:
+            self.stdout.write(f"{row['fingerprint']:<14}{row['count']:>8}{row['total']:>12.1f}{row['p95']:>10.1f}{row['max']:>10.1f}")
+            self.stdout.write(f"  {row['sql'][:200]}")
+            for site, count in row['call_sites']:
+                self.stdout.write(f'  {count:>6} x {site}')
+
+        if skipped:
+            self.stderr.write(f'Skipped {skipped} unreadable line(s).')
@@ -0,0 +1,317 @@
+"""
+Metrics Module
+
+
+This module collects runtime metrics and renders them in the Prometheus text exposition format.
+
+Every process keeps its counters and histograms in memory, so recording a sample is a dict update under a
+briefly held lock. Every settings.METRICS_FLUSH_SECONDS the process writes its totals to its own JSON file in
+settings.METRICS_DIR, and a scrape of /metrics merges the files of all worker processes. Files of stopped
+workers are kept so their counts are not lost; clear the directory when deploying.
+
+Collected:
+    - requests, latency, queries and SQL time per view (MetricsMiddleware)
+    - cache hits and misses (the LocMemCache backend below)
+    - email send latency and failures (the EmailBackend below)
+"""
+
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache as BaseLocMemCache
+from django.core.mail.backends.smtp import EmailBackend as BaseEmailBackend
+
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'appointments_http_requests_total': ('counter', 'HTTP requests by view, method and status.'),
+    'appointments_http_request_duration_seconds': ('histogram', 'HTTP request latency by view.'),
+    'appointments_db_queries_total': ('counter', 'SQL queries run by view.'),
+    'appointments_db_query_duration_seconds_total': ('counter', 'Time spent running SQL queries by view.'),
+    'appointments_cache_requests_total': ('counter', 'Cache lookups by cache and result (hit or miss).'),
+    'appointments_email_send_duration_seconds': ('histogram', 'Time taken to send a batch of emails.'),
+    'appointments_email_send_failures_total': ('counter', 'Email batches that failed to send.'),
+}
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# Held by the one thread writing this process's file
+_flush_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = {}
+_last_flush = time.monotonic()
+# pid alone could be reused by a later worker and overwrite this one's file
+_worker_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+
+def sample_key(name, labels):
+
+    """
+    Get the exposition format name of a sample, e.g. 'name{view="dashboard"}'.
+
+    Parameters:
+        name (str): The metric name.
+        labels (dict): The label values.
+
+    Returns:
+        str: The sample name.
+    """
+
+    if not labels:
+        return name
+    pairs = ','.join(label_pair(label, value) for label, value in sorted(labels.items()))
+    return f'{name}{{{pairs}}}'
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def label_pair(label, value):
+    escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'{label}="{escaped}"'
+
+
+def inc(name, labels=None, value=1):
+
+    """
+    Increase a counter.
+
+    Parameters:
+        name (str): The metric name, one of METRICS.
+        labels (dict): The label values.
+        value (float): The amount to add.
+    """
+
+    key = sample_key(name, labels)
+    with _lock:
+        _counters[key] += value
+    maybe_flush()
+
+
+def observe(name, value, labels=None):
+
+    """
+    Record a value in a histogram.
+
+    Parameters:
+        name (str): The metric name, one of METRICS.
+        value (float): The observed value, in seconds.
+        labels (dict): The label values.
+    """
+
+    key = sample_key(name, labels)
+    bucket = bisect.bisect_left(BUCKETS, value)
+    with _lock:
+        # One count per bucket plus the +Inf bucket, then the sum of the values
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        histogram[bucket] += 1
+        histogram[-1] += value
+    maybe_flush()
+
+
+def snapshot():
+
+    """
+    Get a copy of this process's metrics.
+
+    Returns:
+        dict: 'counters' and 'histograms', keyed by sample name.
+    """
+
+    with _lock:
+        return {'counters': dict(_counters), 'histograms': {key: list(value) for key, value in _histograms.items()}}
+
+
+def flush(blocking=True):
+
+    """
+    Write this process's metrics to its file in settings.METRICS_DIR.
+
+    Only one thread writes at a time, and a failed write is logged rather than raised, since flushes happen
+    inside requests and cache lookups.
+
+    Parameters:
+        blocking (bool): Wait for a flush running in another thread instead of leaving the write to it.
+
+    Returns:
+        bool: True if this call wrote the file.
+    """
+
+    global _last_flush
+    if not _flush_lock.acquire(blocking=blocking):
+        return False
+    try:
+        _last_flush = time.monotonic()
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{_worker_id}.json'
+        temporary = directory / f'{_worker_id}-{threading.get_ident()}.tmp'
+        temporary.write_text(json.dumps(snapshot()))
+        # Scrapes never see a half written file
+        os.replace(temporary, path)
+        return True
+    except OSError:
+        logger.warning('Could not write the metrics file', exc_info=True)
+        return False
+    finally:
+        _flush_lock.release()
+
+
+def maybe_flush():
+
+    """
+    Flush if settings.METRICS_FLUSH_SECONDS have passed since the last flush, unless another thread already is.
+    """
+
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_SECONDS:
+        flush(blocking=False)
+
+
+def reset():
+
+    """
+    Forget this process's metrics without writing them, e.g. when tests end.
+    """
+
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+@atexit.register
+def flush_at_exit():
+    if (_counters or _histograms) and settings.configured:
+        flush()
+
+
+def collect():
+
+    """
+    Merge the metrics of all worker processes.
+
+    Returns:
+        dict: 'counters' and 'histograms' summed over the worker files, keyed by sample name.
+    """
+
+    flush()
+    merged = {'counters': defaultdict(float), 'histograms': {}}
+    for path in Path(settings.METRICS_DIR).glob('*.json'):
+        try:
+            worker = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            continue
+        for key, value in worker['counters'].items():
+            merged['counters'][key] += value
+        for key, values in worker['histograms'].items():
+            total = merged['histograms'].setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+    return merged
+
+
+def metric_name(key):
+    return key.split('{', 1)[0]
+
+
+def with_label(key, suffix, label=None):
+
+    """
+    Get a histogram sample name with a suffix and an optional extra label, e.g. 'name_bucket{le="0.1",view="x"}'.
+    """
+
+    name, _, labels = key.partition('{')
+    labels = labels.rstrip('}')
+    if label:
+        labels = f'{label},{labels}' if labels else label
+    return f'{name}{suffix}{{{labels}}}' if labels else f'{name}{suffix}'
+
+
+def render(merged):
+
+    """
+    Render merged metrics in the Prometheus text exposition format.
+
+    Parameters:
+        merged (dict): The result of collect().
+
+    Returns:
+        str: The exposition text.
+    """
+
+    # The lines of each series by metric and sample name; a histogram's lines stay in bucket order
+    series = defaultdict(dict)
+    for key, value in merged['counters'].items():
+        series[metric_name(key)][key] = [f'{key} {format_value(value)}']
+    for key, values in merged['histograms'].items():
+        cumulative = 0
+        lines = []
+        for bound, count in zip(BUCKETS + ('+Inf',), values):
+            cumulative += count
+            lines.append(f'{with_label(key, "_bucket", label_pair("le", bound))} {cumulative}')
+        lines.append(f'{with_label(key, "_sum")} {format_value(values[-1])}')
+        lines.append(f'{with_label(key, "_count")} {cumulative}')
+        series[metric_name(key)][key] = lines
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key in sorted(series.get(name, {})):
+            lines.extend(series[name][key])
+    return '\n'.join(lines) + '\n'
+
+
+class LocMemCache(BaseLocMemCache):
+
+    """
+    Local memory cache that counts hits and misses.
+    """
+
+    _missing = object()
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._name = name
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version)
+        hit = value is not self._missing
+        inc('appointments_cache_requests_total', {'cache': self._name, 'result': 'hit' if hit else 'miss'})
+        return value if hit else default
+
+
+class EmailBackend(BaseEmailBackend):
+
+    """
+    SMTP email backend that records send latency and failures.
+    """
+
+    def send_messages(self, email_messages):
+        started = time.perf_counter()
+        try:
+            sent = super().send_messages(email_messages)
+        except Exception:
+            inc('appointments_email_send_failures_total')
+            raise
+        finally:
+            observe('appointments_email_send_duration_seconds', time.perf_counter() - started)
+
+        if email_messages and not sent:
+            # fail_silently swallowed the error
+            inc('appointments_email_send_failures_total')
+        return sent
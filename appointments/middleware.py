@@ -0,0 +1,217 @@
+"""
+Middleware Module
+
+
+This module contains the middleware of the appointments app.
+
+QueryBudgetMiddleware counts the SQL queries and the SQL time of every request with connection.execute_wrapper(),
+reports them in a Server-Timing header and logs views that run more queries than their budget. Budgets are set
+per URL name in settings.QUERY_BUDGETS, with settings.QUERY_BUDGET_DEFAULT for URLs not listed there.
+
+SlowQueryMiddleware logs the queries of each request that are slower than settings.SLOW_QUERY_THRESHOLD_MS.
+
+ProfilingMiddleware runs requests that ask for it under cProfile, see the profiling module.
+
+MetricsMiddleware records the request count, latency and SQL use of every view for /metrics.
+
+TracingMiddleware starts a trace for a sampled share of requests, see the tracing module.
+"""
+
+import cProfile
+import logging
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import metrics, tracing
+from .profiling import save_profile, should_profile
+from .slow_queries import SlowQueryLogger
+
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+
+    """
+    Record request count, latency, query count and SQL time per view.
+
+    Must come before QueryBudgetMiddleware, whose query counts it reports.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+        metrics.inc('appointments_http_requests_total', {'view': view, 'method': request.method, 'status': response.status_code})
+        metrics.observe('appointments_http_request_duration_seconds', elapsed, {'view': view})
+        if hasattr(request, 'query_count'):
+            metrics.inc('appointments_db_queries_total', {'view': view}, request.query_count)
+            metrics.inc('appointments_db_query_duration_seconds_total', {'view': view}, request.query_seconds)
+
+        return response
+
+
+class QueryCounter:
+
+    """
+    Execute wrapper that counts queries and adds up the time spent running them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def query_budget(request):
+
+    """
+    Get the query budget of the view that handled a request.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object, after URL resolution.
+
+    Returns:
+        int: The maximum number of queries, or None if the view has no budget.
+    """
+
+    default = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return default
+    budget = getattr(settings, 'QUERY_BUDGETS', {}).get(match.url_name, default)
+    if isinstance(budget, dict):
+        # Budgets per method, e.g. {'GET': 8, 'POST': 18}
+        return budget.get(request.method, default)
+    return budget
+
+
+class QueryBudgetMiddleware:
+
+    """
+    Count the queries of each request and enforce the per-view query budgets.
+
+    The count and SQL time are stored on the request as query_count and query_seconds. Queries run while a
+    streaming response is consumed happen after the middleware returns and are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        request.query_count = counter.count
+        request.query_seconds = counter.seconds
+        response['Server-Timing'] = (
+            f'db;desc="{counter.count} queries";dur={counter.seconds * 1000:.1f}, '
+            f'app;dur={(elapsed - counter.seconds) * 1000:.1f}'
+        )
+
+        budget = query_budget(request)
+        if budget is not None and counter.count > budget:
+            logger.warning(
+                'Query budget exceeded: %s %s ran %d queries (budget %d, %.1f ms of SQL)',
+                request.method, request.path, counter.count, budget, counter.seconds * 1000,
+            )
+
+        return response
+
+
+class SlowQueryMiddleware:
+
+    """
+    Log the slow queries of each request, with the application frame that ran them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        slow_query_logger = SlowQueryLogger(settings.SLOW_QUERY_THRESHOLD_MS, request)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(slow_query_logger))
+            return self.get_response(request)
+
+
+class ProfilingMiddleware:
+
+    """
+    Profile the requests that ask for it and store the profile under a new request ID.
+
+    The request ID is returned in the X-Profile-Id header; the profile can then be read on the profiles page.
+    Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+
+        request_id = uuid.uuid4().hex
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        response = profiler.runcall(self.get_response, request)
+        elapsed = time.perf_counter() - started
+
+        save_profile(request_id, profiler, {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'user': request.user.get_username(),
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 1),
+            'recorded_at': timezone.now().isoformat(),
+        })
+        response['X-Profile-Id'] = request_id
+        return response
+
+
+class TracingMiddleware:
+
+    """
+    Trace a sampled share of requests, with every SQL query as a span.
+
+    The trace ID of a traced request is returned in the X-Trace-Id header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with tracing.start_trace(f'{request.method} {request.path}') as trace:
+            if trace is None:
+                return self.get_response(request)
+
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(tracing.trace_query))
+                response = self.get_response(request)
+            response['X-Trace-Id'] = trace.trace_id
+            return response
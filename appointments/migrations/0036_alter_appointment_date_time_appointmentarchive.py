@@ -0,0 +1,36 @@
+# Generated by Django 4.2.2 on 2026-10-19 04:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0035_appointmentchange'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='date_time',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.CreateModel(
+            name='AppointmentArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date_time', models.DateTimeField(db_index=True)),
+                ('time', models.TimeField()),
+                ('duration', models.DurationField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('canceled', 'Canceled')], default='scheduled', max_length=20)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_appointments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date_time'],
+            },
+        ),
+    ]
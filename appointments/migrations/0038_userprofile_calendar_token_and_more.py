@@ -0,0 +1,29 @@
+# Generated by Django 4.2.2 on 2026-10-19 04:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0037_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='calendar_token',
+            field=models.CharField(blank=True, max_length=43, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='schedule_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='schedule_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
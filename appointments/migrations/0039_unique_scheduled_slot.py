@@ -0,0 +1,63 @@
+# Generated by Django 4.2.2 on 2026-10-19 05:30
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+
+def cancel_duplicate_bookings(apps, schema_editor):
+    """
+    Keeps the earliest scheduled appointment of every slot and cancels the rest, like check_overlaps --cancel,
+    so the constraint can be added to databases that still hold double bookings.
+    """
+
+    Appointment = apps.get_model('appointments', 'Appointment')
+    AppointmentChange = apps.get_model('appointments', 'AppointmentChange')
+    UserProfile = apps.get_model('appointments', 'UserProfile')
+
+    scheduled = Appointment.objects.filter(status='scheduled')
+    kept = (
+        scheduled.values('date_time')
+        .annotate(first_id=Min('id'), bookings=Count('id'))
+        .filter(bookings__gt=1)
+        .order_by()
+        .values_list('date_time', 'first_id')
+    )
+    duplicates = []
+    for date_time, first_id in kept:
+        duplicates.extend(
+            scheduled.filter(date_time=date_time).exclude(id=first_id).values_list('id', 'customer_id', 'date_time')
+        )
+    if not duplicates:
+        return
+
+    Appointment.objects.filter(id__in=[row[0] for row in duplicates]).update(status='canceled')
+    AppointmentChange.objects.bulk_create([
+        AppointmentChange(
+            appointment_id=appointment_id,
+            customer_id=customer_id,
+            action='cancel',
+            date_time=date_time,
+            status='canceled',
+        )
+        for appointment_id, customer_id, date_time in duplicates
+    ])
+    UserProfile.objects.filter(Q(pk__in={row[1] for row in duplicates}) | Q(user_type='owner')).update(
+        schedule_version=F('schedule_version') + 1,
+        schedule_changed_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0038_userprofile_calendar_token_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'scheduled')), fields=('date_time',), name='unique_scheduled_slot'),
+        ),
+    ]
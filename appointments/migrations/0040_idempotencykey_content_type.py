@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-19 05:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0039_unique_scheduled_slot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='content_type',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
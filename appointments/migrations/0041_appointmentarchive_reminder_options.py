@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-19 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0040_idempotencykey_content_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentarchive',
+            name='reminder_options',
+            field=models.ManyToManyField(blank=True, to='appointments.reminderoption'),
+        ),
+    ]
@@ -12,14 +12,18 @@ Together, these models form the core data structure of our application.
 
 
 
-from django.db import models
+from django.db import models, IntegrityError, transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import TruncDate
 from django.contrib.auth.models import AbstractUser
 from datetime import datetime, timedelta
 from django.conf import settings
 from django.utils import timezone
 import pytz
+import secrets
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
+from . import tracing
 
 
 class UserProfile(AbstractUser):
@@ -41,9 +45,36 @@ class UserProfile(AbstractUser):
 
     user_type = models.CharField(max_length=10, choices=USER_TYPE_CHOICES)
 
+    # Secret token in the user's calendar subscription URL, created the first time it is needed
+    calendar_token = models.CharField(max_length=43, unique=True, blank=True, null=True)
+    # Bumped whenever one of the user's appointments changes (every change for owners)
+    schedule_version = models.PositiveIntegerField(default=0)
+    schedule_changed_at = models.DateTimeField(default=timezone.now)
+
     def __str__(self):
         return self.username
 
+    def get_calendar_token(self):
+        """
+        Returns the user's calendar subscription token, creating it if needed.
+        """
+
+        if not self.calendar_token:
+            self.calendar_token = secrets.token_urlsafe(32)
+            self.save(update_fields=['calendar_token'])
+        return self.calendar_token
+
+
+def bump_schedule_version(customer_ids):
+    """
+    Marks the schedules of the given customers, and of the owners who see every appointment, as changed.
+    """
+
+    UserProfile.objects.filter(Q(pk__in=customer_ids) | Q(user_type='owner')).update(
+        schedule_version=F('schedule_version') + 1,
+        schedule_changed_at=timezone.now(),
+    )
+
 
 
 class ReminderOption(models.Model):
@@ -58,13 +89,45 @@ class ReminderOption(models.Model):
     
 
 
+class AppointmentQuerySet(models.QuerySet):
+    """
+    Query helpers for appointments.
+    """
+
+    def cancel(self):
+        """
+        Marks the scheduled appointments in the queryset as canceled in bulk, logging a cancel change for each
+        in the same transaction. Returns how many appointments were canceled.
+        """
+
+        with transaction.atomic():
+            rows = list(self.filter(status='scheduled').values_list('id', 'customer_id', 'date_time'))
+            if not rows:
+                return 0
+
+            Appointment.objects.filter(id__in=[row[0] for row in rows]).update(status='canceled')
+            AppointmentChange.objects.bulk_create([
+                AppointmentChange(
+                    appointment_id=appointment_id,
+                    customer_id=customer_id,
+                    action='cancel',
+                    date_time=date_time,
+                    status='canceled',
+                )
+                for appointment_id, customer_id, date_time in rows
+            ])
+            bump_schedule_version({customer_id for _, customer_id, _ in rows})
+
+        return len(rows)
+
+
 class Appointment(models.Model):
     """
     Represents appointments made by users.
     """
         
     customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='customer_appointments')
-    date_time = models.DateTimeField()
+    date_time = models.DateTimeField(db_index=True)
     time = models.TimeField()
     reminder_options = models.ManyToManyField('ReminderOption', blank=True)
     duration = models.DurationField(blank=True, null=True)
@@ -76,11 +139,17 @@ class Appointment(models.Model):
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
 
+    objects = AppointmentQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.customer.username}'s Appointment on {self.date_time.strftime('%Y-%m-%d %H:%M')}"
 
     class Meta:
         ordering = ['date_time']
+        constraints = [
+            # Two requests that both passed the form's availability check cannot both book the slot
+            models.UniqueConstraint(fields=['date_time'], condition=Q(status='scheduled'), name='unique_scheduled_slot'),
+        ]
 
     def save(self, *args, **kwargs):
         """
@@ -92,7 +161,28 @@ class Appointment(models.Model):
             self.date_time = timezone.make_aware(self.date_time, tzinfo)
         self.duration = timezone.timedelta(hours=1)
 
-        super().save(*args, **kwargs)
+        if self._state.adding:
+            action = 'create'
+        elif self.status == 'canceled':
+            action = 'cancel'
+        else:
+            action = 'update'
+
+        # The change log entry is written in the same transaction as the appointment itself
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            AppointmentChange.record(self, action)
+            bump_schedule_version([self.customer_id])
+
+    def delete(self, *args, **kwargs):
+        """
+        Overrides the delete method to log the removal as a cancellation.
+        """
+
+        with transaction.atomic():
+            AppointmentChange.record(self, 'cancel', status='canceled')
+            bump_schedule_version([self.customer_id])
+            return super().delete(*args, **kwargs)
 
     def is_past(self):
         """
@@ -102,6 +192,78 @@ class Appointment(models.Model):
         return self.date_time < now
 
 
+class AppointmentArchive(models.Model):
+    """
+    Represents a past appointment moved out of the Appointment table by the archive_appointments command.
+    The appointment keeps the id it had in the Appointment table.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_appointments')
+    date_time = models.DateTimeField(db_index=True)
+    time = models.TimeField()
+    duration = models.DurationField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES, default='scheduled')
+    reminder_options = models.ManyToManyField('ReminderOption', blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['date_time']
+
+    def __str__(self):
+        return f"{self.customer.username}'s archived Appointment on {self.date_time.strftime('%Y-%m-%d %H:%M')}"
+
+    def is_past(self):
+        """
+        Checks if the appointment is in the past.
+        """
+        return self.date_time < timezone.now()
+
+
+class AppointmentChange(models.Model):
+    """
+    Represents an entry in the append-only log of appointment creations, updates and cancellations.
+    The auto-incrementing id is the monotonic sequence number clients use as their sync cursor.
+    """
+
+    ACTION_CHOICES = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('cancel', 'Cancel'),
+    ]
+
+    # Not a foreign key: canceled appointments are deleted but their log entries must stay
+    appointment_id = models.BigIntegerField()
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='appointment_changes')
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    date_time = models.DateTimeField()
+    status = models.CharField(max_length=20)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['customer', 'id'], name='appointment_change_customer'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.action} of appointment {self.appointment_id}"
+
+    @classmethod
+    def record(cls, appointment, action, status=None):
+        """
+        Appends a log entry for the given appointment, with the given status instead of its current one if set.
+        """
+
+        return cls.objects.create(
+            appointment_id=appointment.pk,
+            customer_id=appointment.customer_id,
+            action=action,
+            date_time=appointment.date_time,
+            status=status or appointment.status,
+        )
+
+
 User = get_user_model()
 
 class BusinessHours(models.Model):
@@ -175,9 +337,10 @@ class BusinessHours(models.Model):
                 raise ValidationError(f"Close time should be after open time for {day}.")
             
 
-    def get_available_hours(self, selected_date):
+    def get_available_hours(self, selected_date, customer=None):
         """
         Gets available hours for scheduling appointments on a selected date.
+        Slots held by customers other than the given one are left out.
         """
 
         # Get the day of the week for the selected date
@@ -187,21 +350,27 @@ class BusinessHours(models.Model):
         open_time = getattr(self, f"{day_of_week}_open_time")
         close_time = getattr(self, f"{day_of_week}_close_time")
 
-        # Get existing appointments for the selected date and selected day
-        existing_appointments = Appointment.objects.filter(
-            date_time__date=selected_date,
-            date_time__time__gte=open_time,
-            date_time__time__lt=close_time,
-            status='scheduled'  # Include only scheduled appointments
-        )
-
-        # Include canceled appointments as available hours
-        canceled_appointments = Appointment.objects.filter(
-            date_time__date=selected_date,
-            date_time__time__gte=open_time,
-            date_time__time__lt=close_time,
-            status='canceled'  # Include only canceled appointments
-        )
+        # A date_time range, unlike a date_time__date lookup, can use the date_time index
+        day_start = timezone.make_aware(datetime.combine(selected_date, datetime.min.time()))
+        day_end = timezone.make_aware(datetime.combine(selected_date + timedelta(days=1), datetime.min.time()))
+
+        with tracing.span('availability.query', date=selected_date.isoformat()):
+            # Get the times already taken on the selected date, both scheduled and canceled
+            # appointments occupy their slot
+            taken_times = set(
+                Appointment.objects.filter(
+                    date_time__gte=day_start,
+                    date_time__lt=day_end,
+                    date_time__time__gte=open_time,
+                    date_time__time__lt=close_time,
+                ).values_list('date_time__time', flat=True)
+            )
+
+            # Slots another customer is currently holding are not offered either
+            held_times = SlotHold.objects.active().filter(date_time__gte=day_start, date_time__lt=day_end)
+            if customer is not None:
+                held_times = held_times.exclude(customer=customer)
+            taken_times.update(held_times.values_list('date_time__time', flat=True))
 
         # Assuming each appointment has a duration of 1 hour
         appointment_duration = timedelta(hours=1)
@@ -209,22 +378,128 @@ class BusinessHours(models.Model):
         # Generate a list of available hours
         available_hours = []
         current_time = datetime.combine(selected_date, open_time)
-
-        # Filter out past hours
-        current_datetime = datetime.now()
-        if current_datetime.date() == selected_date:
-            current_time = max(current_time, current_datetime)
+        now = timezone.now()
 
         while current_time + appointment_duration <= datetime.combine(selected_date, close_time):
-            # Check if the current time is not conflicting with existing appointments or canceled appointments
-            if not existing_appointments.filter(date_time__time=current_time.time()) and not canceled_appointments.filter(date_time__time=current_time.time()):
+            # Slots stay on the grid from the opening time; past ones, and ones conflicting with existing
+            # appointments or held slots, are left out
+            if current_time.time() not in taken_times and timezone.make_aware(current_time) > now:
                 available_hours.append(current_time.time().strftime('%H:%M'))
 
             current_time += appointment_duration
 
         return available_hours
 
-        
+    def slot_conflict(self, date_time, customer=None):
+        """
+        Checks in a single query whether a slot is already booked, or held by a customer other than the given one.
+        Returns 'booked', 'held' or None if the slot is free.
+        """
+
+        booked = Appointment.objects.filter(date_time=date_time).annotate(
+            conflict=Value('booked', output_field=models.CharField()),
+        ).values_list('conflict', flat=True).order_by()
+
+        held = SlotHold.objects.active().filter(date_time=date_time)
+        if customer is not None:
+            held = held.exclude(customer=customer)
+        held = held.annotate(conflict=Value('held', output_field=models.CharField())).values_list('conflict', flat=True).order_by()
+
+        conflicts = list(booked.union(held, all=True).order_by('conflict')[:1])
+        return conflicts[0] if conflicts else None
+
+    def slot_times(self):
+        """
+        Gets the one-hour slot start times offered on each day of the week, Monday first.
+        """
+
+        appointment_duration = timedelta(hours=1)
+        week = []
+        for day, _ in self.DAYS_OF_WEEK:
+            close_time = datetime.combine(datetime.min, self.get_close_hours(day))
+            current_time = datetime.combine(datetime.min, self.get_open_hours(day))
+            times = []
+            while current_time + appointment_duration <= close_time:
+                times.append(current_time.time())
+                current_time += appointment_duration
+            week.append(times)
+        return week
+
+    def next_available_slots(self, start, count, customer=None, max_days=None):
+        """
+        Gets the first free slots at or after start, searching at most max_days ahead (by default
+        NEXT_AVAILABLE_MAX_WINDOWS windows, which bounds the number of queries).
+        Days are scanned in windows of NEXT_AVAILABLE_WINDOW_DAYS: one grouped query counts the booked slots
+        per day so fully booked days are skipped, and the taken and held times are only read for the rest.
+        Bookings off the slot grid, such as imported ones, take no slot and are not counted.
+        """
+
+        if max_days is None:
+            max_days = self.NEXT_AVAILABLE_WINDOW_DAYS * self.NEXT_AVAILABLE_MAX_WINDOWS
+        start = timezone.localtime(start)
+        week = self.slot_times()
+        slots = []
+
+        on_grid = Q()
+        for weekday, times in enumerate(week):
+            if times:
+                on_grid |= Q(date_time__iso_week_day=weekday + 1, date_time__time__in=times)
+
+        first_day = start.date()
+        last_day = first_day + timedelta(days=max_days)
+        window_start = first_day
+
+        while window_start < last_day and len(slots) < count:
+            window_end = min(window_start + timedelta(days=self.NEXT_AVAILABLE_WINDOW_DAYS), last_day)
+            window = (
+                timezone.make_aware(datetime.combine(window_start, datetime.min.time())),
+                timezone.make_aware(datetime.combine(window_end, datetime.min.time())),
+            )
+
+            booked_per_day = dict(
+                Appointment.objects.filter(on_grid, date_time__gte=window[0], date_time__lt=window[1])
+                .annotate(day=TruncDate('date_time'))
+                .values('day')
+                .annotate(booked=Count('date_time', distinct=True))
+                .order_by()
+                .values_list('day', 'booked')
+            )
+
+            candidate_days = []
+            day = window_start
+            while day < window_end:
+                if booked_per_day.get(day, 0) < len(week[day.weekday()]):
+                    candidate_days.append(day)
+                day += timedelta(days=1)
+
+            if candidate_days:
+                taken = set(
+                    Appointment.objects.filter(
+                        date_time__gte=window[0], date_time__lt=window[1], date_time__date__in=candidate_days
+                    ).values_list('date_time', flat=True)
+                )
+                held = SlotHold.objects.active().filter(date_time__gte=window[0], date_time__lt=window[1])
+                if customer is not None:
+                    held = held.exclude(customer=customer)
+                taken.update(held.values_list('date_time', flat=True))
+
+                for day in candidate_days:
+                    for slot_time in week[day.weekday()]:
+                        slot = timezone.make_aware(datetime.combine(day, slot_time))
+                        if slot >= start and slot not in taken:
+                            slots.append(slot)
+                            if len(slots) == count:
+                                return slots
+
+            window_start = window_end
+
+        return slots
+
+    # Number of days next_available_slots() covers with each round of queries
+    NEXT_AVAILABLE_WINDOW_DAYS = 31
+    # Rounds of at most three queries next_available_slots() runs by default, so it searches about four months ahead
+    NEXT_AVAILABLE_MAX_WINDOWS = 4
+
     DAYS_OF_WEEK = [
         ('monday', 'Monday'),
         ('tuesday', 'Tuesday'),
@@ -233,4 +508,177 @@ class BusinessHours(models.Model):
         ('friday', 'Friday'),
         ('saturday', 'Saturday'),
         ('sunday', 'Sunday'),
-    ]
\ No newline at end of file
+    ]
+
+
+class SlotHoldQuerySet(models.QuerySet):
+    """
+    Query helpers for slot holds.
+    """
+
+    def active(self):
+        """
+        Returns the holds that have not expired yet.
+        """
+
+        return self.filter(expires_at__gt=timezone.now())
+
+    def expire_stale(self):
+        """
+        Deletes every expired hold in a single statement and returns how many were removed.
+        """
+
+        deleted, _ = self.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+class SlotHold(models.Model):
+    """
+    Represents a short-lived hold a customer places on a time slot while filling in the booking form.
+    """
+
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='slot_holds')
+    date_time = models.DateTimeField(unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = SlotHoldQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.customer.username}'s hold on {self.date_time.strftime('%Y-%m-%d %H:%M')}"
+
+    @classmethod
+    def place(cls, customer, date_time):
+        """
+        Holds the slot at date_time for the customer, releasing any other slot they were holding.
+        Returns the hold, or None if another customer is already holding the slot.
+        """
+
+        expires_at = timezone.now() + timedelta(seconds=settings.SLOT_HOLD_TTL_SECONDS)
+
+        try:
+            with transaction.atomic():
+                cls.objects.filter(customer=customer).exclude(date_time=date_time).delete()
+                cls.objects.filter(date_time=date_time, expires_at__lte=timezone.now()).delete()
+                hold, created = cls.objects.get_or_create(
+                    date_time=date_time,
+                    defaults={'customer': customer, 'expires_at': expires_at},
+                )
+        except IntegrityError:
+            return None
+
+        if not created:
+            if hold.customer_id != customer.pk:
+                return None
+            hold.expires_at = expires_at
+            hold.save(update_fields=['expires_at'])
+
+        return hold
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    """
+    Query helpers for idempotency keys.
+    """
+
+    def expired(self):
+        """
+        Returns the keys older than IDEMPOTENCY_KEY_TTL_SECONDS.
+        """
+
+        cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS)
+        return self.filter(created_at__lte=cutoff)
+
+    def purge_expired(self):
+        """
+        Deletes every expired key in a single statement and returns how many were removed.
+        """
+
+        deleted, _ = self.expired().delete()
+        return deleted
+
+
+class IdempotencyKey(models.Model):
+    """
+    Represents an Idempotency-Key sent by a client with a POST, along with a fingerprint of the request
+    and the response that was returned for it, so retries can be answered without running the view again.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=64)
+    fingerprint = models.CharField(max_length=64)
+    # Stays empty while the first request carrying the key is still being processed
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    location = models.CharField(max_length=255, blank=True)
+    content_type = models.CharField(max_length=255, blank=True)
+    content = models.BinaryField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}'s idempotency key {self.key}"
+
+    def is_expired(self):
+        """
+        Checks if the key is older than IDEMPOTENCY_KEY_TTL_SECONDS.
+        """
+
+        return self.created_at <= timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS)
+
+    def take_over(self):
+        """
+        Claims a key whose first request never stored a response within IDEMPOTENCY_PENDING_TIMEOUT_SECONDS.
+        Returns False if the key is not abandoned or a concurrent retry claimed it first.
+        """
+
+        cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_PENDING_TIMEOUT_SECONDS)
+        if self.status_code is not None or self.created_at > cutoff:
+            return False
+        now = timezone.now()
+        claimed = IdempotencyKey.objects.filter(pk=self.pk, status_code__isnull=True, created_at=self.created_at).update(created_at=now)
+        if claimed:
+            self.created_at = now
+        return bool(claimed)
+
+
+class ReportJob(models.Model):
+    """
+    Represents a request for a PDF report, rendered in the background by the run_report_worker command.
+    """
+
+    KIND_CHOICES = [
+        ('schedule', 'Schedule'),
+        ('activity', 'Activity'),
+    ]
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='report_jobs')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    file = models.FileField(upload_to='reports/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='report_job_queue'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} report {self.period_start} - {self.period_end} ({self.status})"
+
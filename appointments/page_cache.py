@@ -0,0 +1,133 @@
+"""
+Page Cache Module
+
+
+This module provides the anonymous_page_cache view decorator for pages that look the same to every anonymous
+visitor, such as the home, login and registration pages.
+
+The first anonymous GET of a page renders it as usual and stores its content in the cache with the CSRF token
+replaced by a placeholder. Later anonymous GETs are answered from the cache with the visitor's own token put
+back in, without running the view, the template engine or any query. Visitors with a session or pending
+messages may see something personal, so they always get the view.
+"""
+
+import re
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+
+PAGE_CACHE_HEADER = 'X-Page-Cache'
+CSRF_PLACEHOLDER = b'__csrf_token_placeholder__'
+# The hidden input rendered by {% csrf_token %}
+CSRF_INPUT = re.compile(rb'name="csrfmiddlewaretoken" value="([A-Za-z0-9]+)"')
+
+
+def is_anonymous_page_request(request):
+
+    """
+    Check whether a request may be answered with the shared anonymous version of a page.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        bool: True for GET and HEAD requests without a session or messages cookie.
+    """
+
+    return (
+        request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+
+
+def page_cache_key(request):
+    # The pages read no query parameters, so campaign links with utm_* parameters share one entry
+    return f'page:{request.path}'
+
+
+def store_page(key, response):
+
+    """
+    Store a rendered page with its CSRF token replaced by the placeholder.
+
+    Parameters:
+        key (str): The cache key.
+        response (HttpResponse): The response of the view.
+
+    Returns:
+        tuple: The stored content, content type and whether the page has a CSRF token.
+    """
+
+    content = response.content
+    tokens = set(CSRF_INPUT.findall(content))
+    for token in tokens:
+        content = content.replace(token, CSRF_PLACEHOLDER)
+    page = (content, response['Content-Type'], bool(tokens))
+    cache.set(key, page, settings.ANONYMOUS_PAGE_CACHE_SECONDS)
+    return page
+
+
+def patch_page_headers(response, has_token):
+
+    """
+    Set the Cache-Control and Vary headers of an anonymous page.
+
+    A page carrying a CSRF token is for one visitor only and is revalidated on every use, since the token
+    changes when the visitor logs in. Other pages may be kept by any cache for ANONYMOUS_PAGE_CACHE_SECONDS.
+    """
+
+    if has_token:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.ANONYMOUS_PAGE_CACHE_SECONDS)
+    # Visitors with a session cookie get a different page
+    patch_vary_headers(response, ('Cookie',))
+
+
+def anonymous_page_cache(view_func):
+
+    """
+    Serve a page to anonymous visitors from the cache.
+
+    Requests that are not anonymous GETs go straight to the view, and responses that are not a plain 200
+    page (redirects, errors, responses setting cookies or the session) are not stored.
+
+    Parameters:
+        view_func (callable): The view to wrap.
+
+    Returns:
+        callable: The wrapped view.
+    """
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not is_anonymous_page_request(request):
+            return view_func(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        page = cache.get(key)
+        if page is None:
+            response = view_func(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or response.cookies or request.session.modified:
+                return response
+            _, _, has_token = store_page(key, response)
+            response[PAGE_CACHE_HEADER] = 'miss'
+        else:
+            content, content_type, has_token = page
+            if has_token:
+                # get_token() also makes CsrfViewMiddleware set the visitor's CSRF cookie
+                content = content.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+            response = HttpResponse(content, content_type=content_type)
+            response[PAGE_CACHE_HEADER] = 'hit'
+
+        patch_page_headers(response, has_token)
+        return response
+
+    return _wrapped_view
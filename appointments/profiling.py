@@ -0,0 +1,183 @@
+"""
+Profiling Module
+
+
+This module stores and reads the request profiles recorded by ProfilingMiddleware.
+
+A request is profiled when a staff user adds ?profile=1 to the URL, or when it carries an X-Profile header
+with a token from `python manage.py profile_token`. Each profile is written to settings.PROFILE_DIR as a
+cProfile stats file plus a small JSON file describing the request, both named after the request ID. The
+directory is kept under settings.PROFILE_STORAGE_MAX_BYTES by deleting the least recently used profiles;
+viewing a profile counts as using it.
+"""
+
+import json
+import os
+import pstats
+import re
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SALT = 'appointments.profiling'
+REQUEST_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def make_profile_token():
+
+    """
+    Create a signed token that enables profiling for requests carrying it in the X-Profile header.
+
+    Returns:
+        str: The token; it expires after settings.PROFILE_TOKEN_MAX_AGE seconds.
+    """
+
+    return signing.dumps('profile', salt=PROFILE_SALT)
+
+
+def should_profile(request):
+
+    """
+    Check whether a request asked to be profiled.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object, after authentication.
+
+    Returns:
+        bool: True for staff users passing ?profile=1 and for requests with a valid X-Profile token.
+    """
+
+    if request.GET.get('profile') == '1' and request.user.is_staff:
+        return True
+
+    token = request.headers.get(PROFILE_HEADER)
+    if not token:
+        return False
+    try:
+        return signing.loads(token, salt=PROFILE_SALT, max_age=settings.PROFILE_TOKEN_MAX_AGE) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+def profile_paths(request_id):
+
+    """
+    Get the stats and metadata file paths of a profile.
+
+    Parameters:
+        request_id (str): The request ID.
+
+    Returns:
+        tuple: The stats path and the metadata path.
+    """
+
+    if not REQUEST_ID.match(request_id):
+        raise ValueError(f'Invalid request ID {request_id!r}')
+    directory = Path(settings.PROFILE_DIR)
+    return directory / f'{request_id}.prof', directory / f'{request_id}.json'
+
+
+def save_profile(request_id, profiler, meta):
+
+    """
+    Store a profile and evict the least recently used profiles beyond the storage limit.
+
+    Parameters:
+        request_id (str): The request ID.
+        profiler (Profile): The finished cProfile profiler.
+        meta (dict): What to show about the request in the profile list.
+    """
+
+    stats_path, meta_path = profile_paths(request_id)
+    stats_path.parent.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(stats_path)
+    meta_path.write_text(json.dumps(meta))
+    enforce_storage_limit()
+
+
+def enforce_storage_limit():
+
+    """
+    Delete the least recently used profiles until the directory fits in settings.PROFILE_STORAGE_MAX_BYTES.
+    """
+
+    profiles = []
+    total = 0
+    for stats_path in Path(settings.PROFILE_DIR).glob('*.prof'):
+        meta_path = stats_path.with_suffix('.json')
+        try:
+            size = stats_path.stat().st_size + (meta_path.stat().st_size if meta_path.exists() else 0)
+            profiles.append((stats_path.stat().st_mtime, size, stats_path, meta_path))
+        except FileNotFoundError:
+            # Evicted by another process in the meantime
+            continue
+        total += size
+
+    for _, size, stats_path, meta_path in sorted(profiles):
+        if total <= settings.PROFILE_STORAGE_MAX_BYTES:
+            break
+        stats_path.unlink(missing_ok=True)
+        meta_path.unlink(missing_ok=True)
+        total -= size
+
+
+def list_profiles():
+
+    """
+    Get the stored profiles, most recently used first.
+
+    Returns:
+        list: The metadata dicts of the profiles, each with its request_id.
+    """
+
+    profiles = []
+    for meta_path in Path(settings.PROFILE_DIR).glob('*.json'):
+        try:
+            meta = json.loads(meta_path.read_text())
+            meta['request_id'] = meta_path.stem
+            meta['last_used'] = datetime.fromtimestamp(meta_path.with_suffix('.prof').stat().st_mtime)
+        except (FileNotFoundError, ValueError):
+            continue
+        profiles.append(meta)
+    return sorted(profiles, key=lambda meta: meta['last_used'], reverse=True)
+
+
+def hottest_functions(request_id, sort='tottime', limit=40):
+
+    """
+    Get the functions a profiled request spent the most time in, and mark the profile as used.
+
+    Parameters:
+        request_id (str): The request ID.
+        sort (str): 'tottime' for time in the function itself, 'cumtime' to include the functions it called.
+        limit (int): Maximum number of functions.
+
+    Returns:
+        tuple: The metadata dict and a list of dicts with function, location, calls, tottime_ms and cumtime_ms.
+
+    Raises:
+        FileNotFoundError: If there is no such profile.
+    """
+
+    stats_path, meta_path = profile_paths(request_id)
+    stats = pstats.Stats(str(stats_path))
+    meta = json.loads(meta_path.read_text())
+    os.utime(stats_path)
+
+    rows = []
+    base_dir = str(settings.BASE_DIR) + os.sep
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        location = f'{filename.removeprefix(base_dir)}:{line}' if line else filename
+        rows.append({
+            'function': function,
+            'location': location,
+            'calls': calls,
+            'tottime_ms': tottime * 1000,
+            'cumtime_ms': cumtime * 1000,
+        })
+    rows.sort(key=lambda row: row[f'{sort}_ms'], reverse=True)
+    return meta, rows[:limit]
@@ -0,0 +1,186 @@
+"""
+Reports Module
+
+
+This module renders the PDF reports requested through ReportJob. Rendering runs in the worker processes started
+by the run_report_worker command, never inside a request. Schedule reports stream their rows from the database
+and draw them page by page, so memory use does not depend on the length of the period.
+"""
+
+import tempfile
+import traceback
+from datetime import datetime, timedelta
+
+from django.core.files import File
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+
+from .analytics import build_report
+from .archive import stream_appointments
+from .models import BusinessHours, ReportJob
+
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 2 * cm
+LINE_HEIGHT = 0.6 * cm
+
+SCHEDULE_COLUMNS = [('Date', 0), ('Time', 4 * cm), ('Customer', 6.5 * cm), ('Status', 13 * cm)]
+
+
+class ReportCanvas:
+    """
+    Writes lines of text onto A4 pages, starting a new page with the column header when one is full.
+    """
+
+    def __init__(self, target, title, columns):
+        self.canvas = canvas.Canvas(target, pagesize=A4)
+        self.title = title
+        self.columns = columns
+        self.page = 0
+        self.start_page()
+
+    def start_page(self):
+        """
+        Starts a new page with the title and the column header.
+        """
+
+        if self.page:
+            self.canvas.showPage()
+        self.page += 1
+        self.y = PAGE_HEIGHT - MARGIN
+        self.canvas.setFont('Helvetica-Bold', 14)
+        self.canvas.drawString(MARGIN, self.y, self.title)
+        self.canvas.setFont('Helvetica', 8)
+        self.canvas.drawRightString(PAGE_WIDTH - MARGIN, self.y, f'Page {self.page}')
+        self.y -= 2 * LINE_HEIGHT
+        self.row([label for label, _ in self.columns], bold=True)
+
+    def row(self, values, bold=False):
+        """
+        Writes one line of values, one per column.
+        """
+
+        if self.y < MARGIN:
+            self.start_page()
+        self.canvas.setFont('Helvetica-Bold' if bold else 'Helvetica', 10)
+        for value, (_, offset) in zip(values, self.columns):
+            self.canvas.drawString(MARGIN + offset, self.y, str(value))
+        self.y -= LINE_HEIGHT
+
+    def save(self):
+        """
+        Finishes the last page and writes the PDF.
+        """
+
+        self.canvas.save()
+
+
+def period_bounds(job):
+
+    """
+    Get the datetime bounds of a report period.
+
+    Parameters:
+        job (ReportJob): The report job.
+
+    Returns:
+        tuple: Timezone-aware (start, end) datetimes, end exclusive.
+    """
+
+    start = timezone.make_aware(datetime.combine(job.period_start, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(job.period_end + timedelta(days=1), datetime.min.time()))
+    return start, end
+
+
+def schedule_rows(job):
+
+    """
+    Stream the appointments of a report period.
+
+    Rows are streamed from the hot table and, when the period reaches into it, the archive,
+    without loading either table into memory.
+
+    Parameters:
+        job (ReportJob): The report job.
+
+    Returns:
+        iterator: (date_time, username, status) tuples ordered by date_time.
+    """
+
+    start, end = period_bounds(job)
+    return stream_appointments(['date_time', 'customer__username', 'status'], start, end)
+
+
+def draw_schedule(job, target):
+
+    """
+    Draw the schedule report: one line per appointment in the period.
+    """
+
+    title = f'Schedule {job.period_start:%B %d, %Y} - {job.period_end:%B %d, %Y}'
+    report = ReportCanvas(target, title, SCHEDULE_COLUMNS)
+    for date_time, username, status in schedule_rows(job):
+        local = timezone.localtime(date_time)
+        report.row([f'{local:%a %b %d, %Y}', f'{local:%H:%M}', username, status.capitalize()])
+    report.save()
+
+
+def draw_activity(job, target):
+
+    """
+    Draw the activity report: totals, cancellation rate, utilization and bookings per day.
+    """
+
+    business_hours = BusinessHours.objects.first()
+    if business_hours is None:
+        raise ValueError('Business hours not set yet.')
+    data = build_report(job.period_start, job.period_end, business_hours)
+
+    title = f'Activity {job.period_start:%B %d, %Y} - {job.period_end:%B %d, %Y}'
+    report = ReportCanvas(target, title, [('Date', 0), ('Bookings', 6 * cm), ('Canceled', 10 * cm)])
+    totals = data['totals']
+    report.row(['Total', totals['bookings'], totals['canceled']], bold=True)
+    report.row([f"Cancellation rate {totals['cancellation_rate']:.1%}", '', ''])
+    report.row([f"Utilization {totals['utilization']:.1%}", '', ''])
+    for day in data['bookings_per_day']:
+        report.row([day['date'], day['bookings'], day['canceled']])
+    report.save()
+
+
+RENDERERS = {
+    'schedule': draw_schedule,
+    'activity': draw_activity,
+}
+
+
+def render_report(job_id):
+
+    """
+    Render a report job to PDF and store the file.
+
+    Marks the job as done with its file, or as failed with the error if rendering raised.
+
+    Parameters:
+        job_id (int): The ID of the report job.
+
+    Returns:
+        str: The final status of the job.
+    """
+
+    job = ReportJob.objects.get(pk=job_id)
+
+    try:
+        with tempfile.TemporaryFile() as target:
+            RENDERERS[job.kind](job, target)
+            target.seek(0)
+            job.file.save(f'{job.kind}-{job.period_start:%Y%m%d}-{job.period_end:%Y%m%d}-{job.pk}.pdf', File(target), save=False)
+        job.status = 'done'
+    except Exception:
+        job.status = 'failed'
+        job.error = traceback.format_exc()
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'status', 'error', 'finished_at'])
+    return job.status
@@ -0,0 +1,182 @@
+"""
+Slow Query Module
+
+
+This module logs SQL queries that take longer than settings.SLOW_QUERY_THRESHOLD_MS. Each entry records the
+duration, the SQL and its fingerprint, the parameters with strings redacted, the request, and the application
+frame the query was run from, so a slow query can be traced back to the view or model method responsible.
+
+Entries go to the 'appointments.slow_queries' logger; settings.LOGGING writes them as JSON lines to a rotating
+file, which the slow_queries management command summarizes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Frames in these files are never reported as the call site
+INTERNAL_FILES = {__file__, os.path.join(os.path.dirname(__file__), 'middleware.py')}
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+# Parameters of these types are logged as they are, everything else only by type and length
+SAFE_PARAM_TYPES = (bool, int, float, Decimal, date, datetime, dt_time, timedelta, type(None))
+
+
+def normalize_sql(sql):
+
+    """
+    Normalize SQL so queries that differ only in their values look the same.
+
+    Literals become '?', lists of placeholders such as IN (%s, %s, %s) become (...), and whitespace is collapsed.
+
+    Parameters:
+        sql (str): The SQL.
+
+    Returns:
+        str: The normalized SQL.
+    """
+
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = PLACEHOLDER_LIST.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+
+    """
+    Get a short stable identifier for normalized SQL.
+
+    Parameters:
+        normalized_sql (str): SQL returned by normalize_sql().
+
+    Returns:
+        str: The first 12 hex digits of its SHA-1.
+    """
+
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()[:12]
+
+
+def redact_param(value):
+
+    """
+    Get a loggable form of a query parameter.
+
+    Numbers, dates and times are kept; strings, bytes and anything else are replaced by their type and length,
+    since they may hold names, emails, tokens or password hashes.
+
+    Parameters:
+        value: The parameter.
+
+    Returns:
+        The value, or a placeholder string.
+    """
+
+    if isinstance(value, SAFE_PARAM_TYPES):
+        return value if isinstance(value, (bool, int, float, type(None))) else str(value)
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return f'<{type(value).__name__}:{len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+def redact_params(params, many):
+
+    """
+    Redact the parameters of a query.
+
+    Parameters:
+        params: The parameters passed to execute() or executemany().
+        many (bool): Whether params is a sequence of parameter sets.
+
+    Returns:
+        list: The redacted parameters; only the first set and the number of sets for executemany().
+    """
+
+    if params is None:
+        return []
+    if many:
+        params = list(params)
+        return {'sets': len(params), 'first': redact_params(params[0], False) if params else []}
+    if isinstance(params, dict):
+        return {key: redact_param(value) for key, value in params.items()}
+    return [redact_param(value) for value in params]
+
+
+def call_site():
+
+    """
+    Find the innermost application frame on the current stack.
+
+    Returns:
+        str: 'path:line in function', with the path relative to BASE_DIR, or '' if no application frame was found.
+    """
+
+    base_dir = str(settings.BASE_DIR) + os.sep
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base_dir) and 'site-packages' not in filename and filename not in INTERNAL_FILES:
+            return f'{os.path.relpath(filename, base_dir)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return ''
+
+
+class SlowQueryLogger:
+
+    """
+    Execute wrapper that logs queries slower than the threshold.
+    """
+
+    def __init__(self, threshold_ms, request=None):
+        self.threshold_ms = threshold_ms
+        self.request = request
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if duration_ms >= self.threshold_ms:
+                self.log(sql, params, many, duration_ms, context)
+
+    def log(self, sql, params, many, duration_ms, context):
+        normalized = normalize_sql(sql)
+        entry = {
+            'duration_ms': round(duration_ms, 3),
+            'fingerprint': fingerprint(normalized),
+            'sql': normalized,
+            'params': redact_params(params, many),
+            'call_site': call_site(),
+            'database': context['connection'].alias,
+        }
+        if self.request is not None:
+            entry['request'] = f'{self.request.method} {self.request.path}'
+        logger.warning('Slow query %s took %.1f ms at %s', entry['fingerprint'], duration_ms, entry['call_site'], extra={'slow_query': entry})
+
+
+class JsonFormatter(logging.Formatter):
+
+    """
+    Formats slow query records as one JSON object per line.
+    """
+
+    def format(self, record):
+        entry = {'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds')}
+        entry.update(getattr(record, 'slow_query', {'message': record.getMessage()}))
+        return json.dumps(entry, default=str)
@@ -0,0 +1,99 @@
+"""
+Storage Module
+
+
+This module contains the static files storage used when DEBUG is off.
+
+CompressedManifestStaticFilesStorage is Django's ManifestStaticFilesStorage, which copies every static file
+under a name containing a hash of its content, plus a gzip variant (name.gz) and, when the optional brotli
+package is installed, a brotli variant (name.br) of each hashed text file. The variants are written once by
+collectstatic, so views.static_asset only has to pick the smallest one the browser accepts. hashed_names()
+tells it which names carry a content hash and can be cached for good.
+"""
+
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Extensions worth compressing; images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml')
+# Smaller files gain less than the bytes of the extra headers
+COMPRESS_MIN_BYTES = 256
+
+# Content-Encoding of each variant by file suffix, best first
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+
+def compress(content):
+
+    """
+    Compress file content in every available encoding.
+
+    Parameters:
+        content (bytes): The file content.
+
+    Returns:
+        dict: The compressed content by file suffix, leaving out variants that are not smaller.
+    """
+
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, mode=brotli.MODE_TEXT)
+    return {suffix: data for suffix, data in variants.items() if len(data) < len(content)}
+
+
+def hashed_names(storage):
+
+    """
+    Get the content-hashed file names of a static files storage.
+
+    The set is built once per manifest and kept on the storage. A storage replaces its hashed_files dict when
+    it loads or writes a manifest, so a new dict, or one that grew, means the set is rebuilt.
+
+    Parameters:
+        storage (Storage): The static files storage.
+
+    Returns:
+        frozenset: The hashed names, empty for a storage without a manifest.
+    """
+
+    hashed_files = getattr(storage, 'hashed_files', None)
+    if not hashed_files:
+        return frozenset()
+    cached = getattr(storage, '_hashed_names', None)
+    if cached is None or cached[0] is not hashed_files or cached[1] != len(hashed_files):
+        cached = (hashed_files, len(hashed_files), frozenset(hashed_files.values()))
+        storage._hashed_names = cached
+    return cached[2]
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    """
+    Manifest static files storage that also writes compressed variants of the hashed files.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        # hashed_files holds the final names once every post-processing pass is done
+        for name in set(self.hashed_files.values()):
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+                continue
+            with self.open(name) as original:
+                content = original.read()
+            if len(content) < COMPRESS_MIN_BYTES:
+                continue
+            for suffix, data in compress(content).items():
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(data))
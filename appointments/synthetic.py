@@ -0,0 +1,306 @@
+"""
+Synthetic Data Module
+
+
+This module generates realistic customers, appointments and appointment reminder options for scale and
+performance testing. Everything is written in large batches: customers get an unusable password hash instead
+of going through create_user(), appointments are given explicit ids so their reminder options can be linked
+without reading them back, and on SQLite the appointment rows can optionally be written with raw executemany()
+instead of bulk_create(). The same seed always produces the same data.
+
+Generated rows bypass Appointment.save(), so they are not recorded in the change log, but the schedule
+versions of the customers they belong to are bumped so cached dashboards show them.
+"""
+
+import math
+import random
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .models import Appointment, AppointmentArchive, BusinessHours, ReminderOption, UserProfile, bump_schedule_version
+
+
+# Appointments are placed on a grid of one-hour slots, 08:00 to 17:00 every day
+OPEN_HOUR = 8
+SLOTS_PER_DAY = 9
+
+# Share of appointments that are canceled, and that have reminder options
+CANCELED_RATE = 0.1
+REMINDER_RATE = 0.3
+
+FIRST_NAMES = [
+    'Noa', 'Yosef', 'Tamar', 'David', 'Maya', 'Ariel', 'Shira', 'Daniel', 'Yael', 'Eitan',
+    'Michal', 'Omer', 'Rachel', 'Itai', 'Hila', 'Amit', 'Lior', 'Avigail', 'Nadav', 'Ruth',
+]
+LAST_NAMES = [
+    'Cohen', 'Levi', 'Mizrahi', 'Peretz', 'Biton', 'Dahan', 'Avraham', 'Friedman', 'Azoulay', 'Katz',
+    'Malka', 'Shapiro', 'Ohana', 'Segal', 'Golan', 'Klein', 'Weiss', 'Hadad', 'Ben David', 'Vaisbrot',
+]
+REMINDER_OPTION_NAMES = ['Email a day before', 'Email an hour before', 'SMS a day before']
+
+
+def span_days_for(appointments):
+
+    """
+    Get the number of days needed to fit appointments on the slot grid.
+
+    Parameters:
+        appointments (int): The number of appointments.
+
+    Returns:
+        int: The number of days, at least a year.
+    """
+
+    return max(365, math.ceil(appointments / SLOTS_PER_DAY) + 1)
+
+
+def ensure_business_hours():
+
+    """
+    Create business hours matching the slot grid if none exist.
+
+    Returns:
+        BusinessHours: The business hours.
+    """
+
+    business_hours = BusinessHours.objects.first()
+    if business_hours is None:
+        BusinessHours.objects.create(**{
+            f'{day}_{edge}_time': f'{hour:02d}:00'
+            for day, _ in BusinessHours.DAYS_OF_WEEK
+            for edge, hour in (('open', OPEN_HOUR), ('close', OPEN_HOUR + SLOTS_PER_DAY))
+        })
+        business_hours = BusinessHours.objects.first()
+    return business_hours
+
+
+def create_reminder_options():
+
+    """
+    Create the standard reminder options if they do not exist.
+
+    Returns:
+        list: The reminder option IDs.
+    """
+
+    return [ReminderOption.objects.get_or_create(name=name)[0].pk for name in REMINDER_OPTION_NAMES]
+
+
+def next_username_number(prefix):
+
+    """
+    Get the number following the highest '<prefix>-<n>' username.
+
+    Parameters:
+        prefix (str): The username prefix.
+
+    Returns:
+        int: One more than the highest n, or 0 if there is no such username.
+    """
+
+    # Longest first, then the highest of the longest: numeric order for suffixes without leading zeros
+    usernames = (
+        UserProfile.objects.filter(username__startswith=f'{prefix}-')
+        .annotate(length=Length('username'))
+        .order_by('-length', '-username')
+        .values_list('username', flat=True)
+    )
+    for username in usernames.iterator():
+        suffix = username[len(prefix) + 1:]
+        if suffix.isdigit():
+            return int(suffix) + 1
+    return 0
+
+
+def create_customers(count, rng, batch_size=10000, prefix='customer'):
+
+    """
+    Create customers with bulk_create().
+
+    All customers share one unusable password hash, so no password hashing happens per user.
+
+    Parameters:
+        count (int): The number of customers.
+        rng (Random): The random generator.
+        batch_size (int): Number of rows per INSERT.
+        prefix (str): Username prefix; usernames are '<prefix>-<n>', numbered on from the highest existing n.
+
+    Returns:
+        list: The new customer IDs.
+    """
+
+    password = make_password(None)
+    start = next_username_number(prefix)
+    customers = []
+    for n in range(start, start + count):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        customers.append(UserProfile(
+            username=f'{prefix}-{n}',
+            password=password,
+            first_name=first_name,
+            last_name=last_name,
+            full_name=f'{first_name} {last_name}',
+            email=f'{prefix}{n}@example.com',
+            phone_number=f'05{rng.randrange(10 ** 8):08d}',
+            receive_reminders=rng.random() < 0.8,
+            user_type='customer',
+        ))
+
+    UserProfile.objects.bulk_create(customers, batch_size=batch_size)
+    return list(
+        UserProfile.objects.filter(username__in=[customer.username for customer in customers]).values_list('id', flat=True)
+    )
+
+
+def appointment_rows(count, customer_ids, rng, first_day, span_days):
+
+    """
+    Generate appointment values on free slots of the grid.
+
+    Parameters:
+        count (int): The number of appointments.
+        customer_ids (list): The customers to book for.
+        rng (Random): The random generator.
+        first_day (date): The first day of the grid.
+        span_days (int): The number of days of the grid.
+
+    Returns:
+        iterator: (customer_id, date_time, time, status) tuples ordered by date_time, which is in UTC.
+    """
+
+    # Clocks change at night, so every slot of a day is a whole number of hours after the opening time
+    times = [dt_time(OPEN_HOUR + offset) for offset in range(SLOTS_PER_DAY)]
+    opening = None
+    for slot in sorted(rng.sample(range(span_days * SLOTS_PER_DAY), count)):
+        day, offset = divmod(slot, SLOTS_PER_DAY)
+        if opening is None or opening[0] != day:
+            local = timezone.make_aware(datetime.combine(first_day + timedelta(days=day), times[0]))
+            opening = (day, local.astimezone(dt_timezone.utc))
+        status = 'canceled' if rng.random() < CANCELED_RATE else 'scheduled'
+        yield rng.choice(customer_ids), opening[1] + timedelta(hours=offset), times[offset], status
+
+
+def create_appointments(count, customer_ids, option_ids, rng, first_day, span_days, batch_size=10000, raw=False):
+
+    """
+    Create appointments and their reminder options in batches.
+
+    Parameters:
+        count (int): The number of appointments.
+        customer_ids (list): The customers to book for.
+        option_ids (list): The reminder options to pick from.
+        rng (Random): The random generator.
+        first_day (date): The first day of the slot grid.
+        span_days (int): The number of days of the slot grid; must fit count appointments.
+        batch_size (int): Number of appointments per transaction.
+        raw (bool): Insert with cursor.executemany() instead of bulk_create(); SQLite only.
+
+    Returns:
+        int: The number of appointments created.
+    """
+
+    raw = raw and connection.vendor == 'sqlite'
+
+    Through = Appointment.reminder_options.through
+    # Archived appointments keep their ids, so new ids must not reuse them either
+    next_id = max(
+        Appointment.objects.aggregate(Max('id'))['id__max'] or 0,
+        AppointmentArchive.objects.aggregate(Max('id'))['id__max'] or 0,
+    ) + 1
+    duration = timedelta(hours=1)
+    rows = appointment_rows(count, customer_ids, rng, first_day, span_days)
+
+    if raw:
+        db_duration = Appointment._meta.get_field('duration').get_db_prep_value(duration, connection)
+        appointment_sql = (
+            f'INSERT INTO {Appointment._meta.db_table} (id, customer_id, date_time, time, duration, status) '
+            f'VALUES (%s, %s, %s, %s, %s, %s)'
+        )
+        through_sql = f'INSERT INTO {Through._meta.db_table} (appointment_id, reminderoption_id) VALUES (%s, %s)'
+
+    created = 0
+    customers = set()
+    while created < count:
+        batch = []
+        links = []
+        for customer_id, date_time, time, status in rows:
+            appointment_id = next_id + created + len(batch)
+            batch.append((appointment_id, customer_id, date_time, time, status))
+            customers.add(customer_id)
+            if option_ids and rng.random() < REMINDER_RATE:
+                links.extend((appointment_id, option_id) for option_id in rng.sample(option_ids, rng.randint(1, len(option_ids))))
+            if len(batch) == batch_size:
+                break
+
+        with transaction.atomic():
+            if raw:
+                with connection.cursor() as cursor:
+                    cursor.executemany(appointment_sql, [
+                        # str() of naive UTC datetimes and of times is how the SQLite backend stores them
+                        (appointment_id, customer_id, str(date_time.replace(tzinfo=None)), str(time), db_duration, status)
+                        for appointment_id, customer_id, date_time, time, status in batch
+                    ])
+                    cursor.executemany(through_sql, links)
+            else:
+                Appointment.objects.bulk_create([
+                    Appointment(id=appointment_id, customer_id=customer_id, date_time=date_time, time=time, duration=duration, status=status)
+                    for appointment_id, customer_id, date_time, time, status in batch
+                ])
+                Through.objects.bulk_create([
+                    Through(appointment_id=appointment_id, reminderoption_id=option_id) for appointment_id, option_id in links
+                ])
+
+        created += len(batch)
+
+    # Explicit ids leave sequences behind on backends that have them
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Appointment, Through]):
+            cursor.execute(sql)
+
+    # In slices, to stay under the database's limit on query parameters
+    customers = sorted(customers)
+    for start in range(0, len(customers), batch_size):
+        bump_schedule_version(customers[start:start + batch_size])
+    return created
+
+
+def generate(customers, appointments, seed=0, batch_size=10000, raw=False, first_day=None):
+
+    """
+    Generate a complete synthetic data set.
+
+    Parameters:
+        customers (int): The number of customers.
+        appointments (int): The number of appointments.
+        seed (int): The random seed.
+        batch_size (int): Number of rows per batch.
+        raw (bool): Insert appointments with cursor.executemany() instead of bulk_create().
+        first_day (date): First day of the slot grid; by default the grid is centred on today, or starts after
+            the latest appointment if there already are appointments.
+
+    Returns:
+        dict: The customer IDs, the first day and the number of days of the slot grid.
+    """
+
+    rng = random.Random(seed)
+    span_days = span_days_for(appointments)
+    if first_day is None:
+        latest = Appointment.objects.aggregate(Max('date_time'))['date_time__max']
+        if latest is None:
+            first_day = timezone.localdate() - timedelta(days=span_days // 2)
+        else:
+            first_day = timezone.localdate(latest) + timedelta(days=1)
+
+    ensure_business_hours()
+    option_ids = create_reminder_options()
+    customer_ids = create_customers(customers, rng, batch_size=batch_size)
+    create_appointments(appointments, customer_ids, option_ids, rng, first_day, span_days, batch_size=batch_size, raw=raw)
+
+    return {'customer_ids': customer_ids, 'first_day': first_day, 'span_days': span_days}
@@ -0,0 +1,34 @@
+"""
+Testing Module
+
+
+This module contains helpers for the app's tests.
+"""
+
+from .middleware import query_budget
+
+
+class QueryBudgetTestMixin:
+
+    """
+    TestCase mixin that checks responses against the query budgets enforced by QueryBudgetMiddleware.
+    """
+
+    def assertWithinQueryBudget(self, response, budget=None):
+
+        """
+        Assert that the request behind a test client response stayed within its query budget.
+
+        Parameters:
+            response (HttpResponse): A test client response.
+            budget (int): The budget to check against; by default the one configured for the view.
+        """
+
+        request = response.wsgi_request
+        if budget is None:
+            budget = query_budget(request)
+        self.assertIsNotNone(budget, f'{request.path} has no query budget')
+        self.assertLessEqual(
+            request.query_count, budget,
+            f'{request.method} {request.path} ran {request.query_count} queries, over its budget of {budget}',
+        )
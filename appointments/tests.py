@@ -1,11 +1,66 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import logging
+import os
+import queue
+import sys
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+from logging.handlers import QueueHandler
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.db import IntegrityError, transaction
+from django.core.cache import cache
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
 from django.contrib.auth import get_user_model
-from .models import Appointment, BusinessHours, ReminderOption
+from django.core import mail
+from django.http import JsonResponse
+from django.urls import reverse
+from .models import Appointment, AppointmentArchive, AppointmentChange, BusinessHours, IdempotencyKey, ReminderOption, SlotHold
+from .archive import appointments_in_window, archive_appointments
+from .reports import render_report
+from .testing import QueryBudgetTestMixin
+from .slow_queries import normalize_sql
+from .profiling import make_profile_token
+from .page_cache import PAGE_CACHE_HEADER
+from .storage import hashed_names
+from .idempotency import idempotent, request_fingerprint
+from . import metrics
+from .log import DeferredQueueHandler, SamplingFilter, SettingFileHandler, StructuredFormatter
+from . import synthetic
+from .management.commands.simulate_booking_load import count_double_bookings
 from .forms import RegistrationForm
 from datetime import datetime, timedelta
 from django.utils import timezone
+from django.utils.formats import date_format
 
 
+# What the tests write to the paths in the settings goes to a temporary directory instead of the working tree
+output_directory = None
+output_settings = None
+
+
+def setUpModule():
+    global output_directory, output_settings
+    output_directory = tempfile.TemporaryDirectory()
+    output_settings = override_settings(
+        SLOW_QUERY_LOG=os.path.join(output_directory.name, 'slow_queries.log'),
+        TRACE_LOG=os.path.join(output_directory.name, 'traces.jsonl'),
+        METRICS_DIR=os.path.join(output_directory.name, 'metrics'),
+        MEDIA_ROOT=os.path.join(output_directory.name, 'media'),
+    )
+    output_settings.enable()
+
+
+def tearDownModule():
+    # Otherwise the metrics of the test requests are flushed to the real METRICS_DIR at exit
+    metrics.reset()
+    output_settings.disable()
+    output_directory.cleanup()
+
 
 class ModelTestCase(TestCase):
     def setUp(self):
@@ -65,3 +120,903 @@ class ModelTestCase(TestCase):
         }
         form = RegistrationForm(data=form_data)
         self.assertFalse(form.is_valid())
+
+
+class SlotHoldTestCase(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.customer = User.objects.create_user(username='customer', password='testpass', user_type='customer')
+        self.other = User.objects.create_user(username='other', password='testpass', user_type='customer')
+        BusinessHours.objects.create()
+        self.business_hours = BusinessHours.objects.first()
+        self.day = (timezone.localtime() + timedelta(days=2)).date()
+        self.slot = timezone.make_aware(datetime.combine(self.day, datetime.strptime('09:00', '%H:%M').time()))
+
+    def test_held_slot_is_hidden_from_other_customers(self):
+        self.assertIsNotNone(SlotHold.place(self.customer, self.slot))
+        self.assertNotIn('09:00', self.business_hours.get_available_hours(self.day, customer=self.other))
+        self.assertIn('09:00', self.business_hours.get_available_hours(self.day, customer=self.customer))
+        self.assertIsNone(SlotHold.place(self.other, self.slot))
+
+    def test_hold_requires_a_future_slot_on_the_grid(self):
+        self.client.force_login(self.customer)
+        yesterday = self.day - timedelta(days=3)
+        for selected_date, time in ((yesterday, '09:00'), (self.day, '09:30'), (self.day, '16:30')):
+            response = self.client.post(reverse('hold_slot'), {'selected_date': selected_date.isoformat(), 'time': time})
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(SlotHold.objects.exists())
+
+        response = self.client.post(reverse('hold_slot'), {'selected_date': self.day.isoformat(), 'time': '09:00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(SlotHold.objects.filter(date_time=self.slot).exists())
+
+    def test_expire_stale_removes_expired_holds(self):
+        SlotHold.objects.create(customer=self.customer, date_time=self.slot, expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(SlotHold.objects.expire_stale(), 1)
+        self.assertIsNotNone(SlotHold.place(self.other, self.slot))
+
+    def test_booking_consumes_hold(self):
+        SlotHold.place(self.customer, self.slot)
+        self.client.force_login(self.customer)
+        self.client.post(reverse('dashboard'), {
+            'date_time_year': self.day.year, 'date_time_month': self.day.month, 'date_time_day': self.day.day,
+            'time': '09:00',
+        })
+        self.assertTrue(Appointment.objects.filter(date_time=self.slot).exists())
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_booking_rejects_off_grid_times_and_lost_races(self):
+        self.client.force_login(self.customer)
+        data = {'date_time_year': self.day.year, 'date_time_month': self.day.month, 'date_time_day': self.day.day}
+        for time in ('09:30', '16:30'):
+            self.client.post(reverse('dashboard'), dict(data, time=time))
+        self.assertFalse(Appointment.objects.exists())
+
+        # The other customer books between this customer's availability check and insert
+        Appointment.objects.create(customer=self.other, date_time=self.slot, time=self.slot.time())
+        with mock.patch.object(BusinessHours, 'slot_conflict', return_value=None):
+            response = self.client.post(reverse('dashboard'), dict(data, time='09:00'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Appointment.objects.filter(date_time=self.slot).count(), 1)
+
+
+class IdempotencyKeyTestCase(TestCase):
+    def setUp(self):
+        self.customer = get_user_model().objects.create_user(
+            username='customer', email='customer@example.com', password='testpass', user_type='customer'
+        )
+        BusinessHours.objects.create()
+        self.day = (timezone.localtime() + timedelta(days=2)).date()
+        self.data = {
+            'date_time_year': self.day.year, 'date_time_month': self.day.month, 'date_time_day': self.day.day,
+            'time': '10:00',
+        }
+        self.client.force_login(self.customer)
+
+    def test_retry_replays_stored_response(self):
+        first = self.client.post(reverse('dashboard'), self.data, HTTP_IDEMPOTENCY_KEY='abc')
+        retry = self.client.post(reverse('dashboard'), self.data, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry['Location'], first['Location'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_key_reused_for_different_request_is_rejected(self):
+        self.client.post(reverse('dashboard'), self.data, HTTP_IDEMPOTENCY_KEY='abc')
+        response = self.client.post(reverse('dashboard'), dict(self.data, time='11:00'), HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, 422)
+
+    def test_abandoned_key_is_taken_over_by_a_retry(self):
+        IdempotencyKey.objects.create(user=self.customer, key='abc', fingerprint=request_fingerprint(
+            RequestFactory().post(reverse('dashboard'), self.data)
+        ))
+        self.assertEqual(self.client.post(reverse('dashboard'), self.data, HTTP_IDEMPOTENCY_KEY='abc').status_code, 409)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(seconds=31))
+        response = self.client.post(reverse('dashboard'), self.data, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 302)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_key_is_released_when_the_view_raises(self):
+        def view(request):
+            raise SystemExit
+
+        request = RequestFactory().post('/', HTTP_IDEMPOTENCY_KEY='abc')
+        request.user = self.customer
+        with self.assertRaises(SystemExit):
+            idempotent(view)(request)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_retry_replays_stored_content_type(self):
+        view = idempotent(lambda request: JsonResponse({'booked': True}, status=201))
+        request = RequestFactory().post('/', HTTP_IDEMPOTENCY_KEY='abc')
+        request.user = self.customer
+        first = view(request)
+        retry = view(request)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry['Content-Type'], first['Content-Type'])
+        self.assertEqual(json.loads(retry.content), {'booked': True})
+
+
+class AppointmentChangeTestCase(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.customer = User.objects.create_user(username='customer', password='testpass', user_type='customer')
+        self.owner = User.objects.create_user(username='owner', password='testpass', user_type='owner')
+        self.appointment = Appointment.objects.create(
+            customer=self.customer, date_time=timezone.now() + timedelta(days=1), time=datetime.now().time()
+        )
+
+    def test_mutations_are_logged_in_order(self):
+        self.appointment.save()
+        self.appointment.delete()
+        changes = list(AppointmentChange.objects.values_list('action', 'status'))
+        self.assertEqual(changes, [('create', 'scheduled'), ('update', 'scheduled'), ('cancel', 'canceled')])
+
+    def test_changes_since_cursor(self):
+        cursor = AppointmentChange.objects.get().id
+        self.appointment.delete()
+        self.client.force_login(self.owner)
+        data = self.client.get(reverse('appointment_changes'), {'since': cursor}).json()
+        self.assertEqual([change['action'] for change in data['changes']], ['cancel'])
+        self.assertEqual(data['next_cursor'], cursor + 1)
+        self.assertFalse(data['has_more'])
+
+
+class CheckOverlapsCommandTestCase(TestCase):
+    def setUp(self):
+        customer = get_user_model().objects.create_user(username='customer', password='testpass', user_type='customer')
+        start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        self.first = Appointment.objects.create(customer=customer, date_time=start, time=start.time())
+        # Exact duplicates of a scheduled slot are rejected by the unique_scheduled_slot constraint
+        self.duplicate = Appointment.objects.create(customer=customer, date_time=start + timedelta(minutes=15), time=start.time())
+        self.overlapping = Appointment.objects.create(customer=customer, date_time=start + timedelta(minutes=30), time=start.time())
+        self.later = Appointment.objects.create(customer=customer, date_time=start + timedelta(hours=1), time=start.time())
+
+    def test_reports_overlaps(self):
+        out = StringIO()
+        call_command('check_overlaps', stdout=out)
+        self.assertIn('found 3 overlap(s)', out.getvalue())
+        self.assertFalse(Appointment.objects.filter(status='canceled').exists())
+
+    def test_cancel_keeps_earliest_booking(self):
+        call_command('check_overlaps', '--cancel', stdout=StringIO())
+        canceled = set(Appointment.objects.filter(status='canceled').values_list('id', flat=True))
+        self.assertEqual(canceled, {self.duplicate.id, self.overlapping.id})
+        self.assertEqual(AppointmentChange.objects.filter(action='cancel').count(), 2)
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(username='owner', password='testpass', user_type='owner')
+        customer = get_user_model().objects.create_user(username='customer', password='testpass', user_type='customer')
+        now = timezone.now()
+        self.old = Appointment.objects.create(customer=customer, date_time=now - timedelta(days=400), time=now.time())
+        self.recent = Appointment.objects.create(customer=customer, date_time=now - timedelta(days=2), time=now.time())
+
+    def test_command_moves_old_appointments(self):
+        option = ReminderOption.objects.create(name='Email')
+        self.old.reminder_options.add(option)
+        call_command('archive_appointments', '--older-than', '365', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(list(Appointment.objects.values_list('id', flat=True)), [self.recent.id])
+        self.assertEqual(list(AppointmentArchive.objects.values_list('id', flat=True)), [self.old.id])
+        self.assertEqual(list(AppointmentArchive.objects.get().reminder_options.all()), [option])
+
+    def test_reads_union_archive_only_when_window_reaches_it(self):
+        archive_appointments(timezone.now() - timedelta(days=365))
+        self.assertEqual([a.id for a in appointments_in_window()], [self.old.id, self.recent.id])
+        # The archive horizon is cached now
+        with self.assertNumQueries(1):
+            recent = appointments_in_window(start=timezone.now() - timedelta(days=30))
+        self.assertEqual([a.id for a in recent], [self.recent.id])
+
+        # Archiving clears the cached horizon
+        archive_appointments(timezone.now())
+        self.assertEqual([a.id for a in appointments_in_window(start=timezone.now() - timedelta(days=30))], [self.recent.id])
+
+        self.client.force_login(self.owner)
+        with self.assertNumQueries(4):
+            data = self.client.get(reverse('get_appointments')).json()
+        self.assertEqual(len(data['appointments']), 1)
+        data = self.client.get(reverse('get_appointments'), {'start': '2000-01-01'}).json()
+        self.assertEqual(len(data['appointments']), 2)
+
+
+class OwnerAnalyticsTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(username='owner', password='testpass', user_type='owner')
+        customer = get_user_model().objects.create_user(username='customer', password='testpass', user_type='customer')
+        BusinessHours.objects.create()
+        self.day = timezone.localdate() - timedelta(days=3)
+        slot = timezone.make_aware(datetime.combine(self.day, datetime.strptime('09:00', '%H:%M').time()))
+        Appointment.objects.create(customer=customer, date_time=slot, time=slot.time())
+        Appointment.objects.create(customer=customer, date_time=slot + timedelta(hours=1), time=slot.time(), status='canceled')
+
+    def test_report(self):
+        self.client.force_login(self.owner)
+        day = self.day.isoformat()
+        report = self.client.get(reverse('owner_analytics'), {'start': day, 'end': day}).json()
+        self.assertEqual(report['totals']['bookings'], 2)
+        self.assertEqual(report['totals']['cancellation_rate'], 0.5)
+        self.assertEqual(report['bookings_per_day'], [{'date': day, 'bookings': 2, 'canceled': 1}])
+        matrix = report['utilization']['matrix']
+        self.assertEqual(matrix[self.day.weekday()][9], 1.0)
+        self.assertEqual(matrix[self.day.weekday()][10], 0.0)
+        self.assertEqual(report['totals']['utilization'], round(1 / 9, 4))
+
+    def test_cancellations_through_the_view_are_counted(self):
+        customer = get_user_model().objects.get(username='customer')
+        day = timezone.localdate() + timedelta(days=3)
+        slot = timezone.make_aware(datetime.combine(day, datetime.strptime('09:00', '%H:%M').time()))
+        appointment = Appointment.objects.create(customer=customer, date_time=slot, time=slot.time())
+        Appointment.objects.create(customer=customer, date_time=slot + timedelta(hours=1), time=slot.time())
+        self.client.force_login(customer)
+        self.client.post(reverse('cancel_appointment', args=[appointment.pk]))
+
+        self.client.force_login(self.owner)
+        report = self.client.get(reverse('owner_analytics'), {'start': day.isoformat(), 'end': day.isoformat()}).json()
+        self.assertEqual(report['totals']['bookings'], 2)
+        self.assertEqual(report['totals']['canceled'], 1)
+        self.assertEqual(report['totals']['cancellation_rate'], 0.5)
+
+
+class ReportJobTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(username='owner', password='testpass', user_type='owner')
+        customer = get_user_model().objects.create_user(username='customer', password='testpass', user_type='customer')
+        BusinessHours.objects.create()
+        for days in range(3):
+            Appointment.objects.create(customer=customer, date_time=timezone.now() - timedelta(days=days), time=datetime.now().time())
+        self.client.force_login(self.owner)
+
+    def test_queue_render_and_download(self):
+        today = timezone.localdate()
+        for kind in ('schedule', 'activity'):
+            response = self.client.post(reverse('request_report'), {
+                'kind': kind, 'start': (today - timedelta(days=7)).isoformat(), 'end': today.isoformat(),
+            })
+            self.assertEqual(response.status_code, 202)
+            job_id = response.json()['id']
+
+            self.assertEqual(render_report(job_id), 'done')
+            status = self.client.get(reverse('report_status', args=[job_id])).json()
+            download = self.client.get(status['download_url'])
+            self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.customer = User.objects.create_user(username='customer', password='testpass', user_type='customer', full_name='Dana, Levi')
+        other = User.objects.create_user(username='other', password='testpass', user_type='customer')
+        start = timezone.now() + timedelta(days=1)
+        self.appointment = Appointment.objects.create(customer=self.customer, date_time=start, time=start.time())
+        Appointment.objects.create(customer=other, date_time=start + timedelta(hours=2), time=start.time())
+        self.client.force_login(self.customer)
+
+    def test_csv_export_streams_own_appointments(self):
+        response = self.client.get(reverse('export_appointments_csv'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,date,time,duration_minutes,status,customer,full_name')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].endswith(',60,scheduled,customer,"Dana, Levi"'))
+
+    def test_ics_export(self):
+        response = self.client.get(reverse('export_appointments_ics'))
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn(f'UID:appointment-{self.appointment.id}@appointmenext', body)
+
+
+class CalendarFeedTestCase(TestCase):
+    def setUp(self):
+        self.customer = get_user_model().objects.create_user(username='customer', password='testpass', user_type='customer')
+        start = timezone.now() + timedelta(days=1)
+        self.appointment = Appointment.objects.create(customer=self.customer, date_time=start, time=start.time())
+        self.url = reverse('calendar_feed', args=[self.customer.get_calendar_token()])
+
+    def test_unchanged_poll_returns_304_without_appointment_queries(self):
+        response = self.client.get(self.url)
+        self.assertIn(b'BEGIN:VEVENT', b''.join(response.streaming_content))
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_appointment_change_invalidates_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.appointment.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'BEGIN:VEVENT', b''.join(response.streaming_content))
+
+
+class ImportAppointmentsCommandTestCase(TestCase):
+    def setUp(self):
+        self.customer = get_user_model().objects.create_user(username='customer', password='testpass', user_type='customer')
+        existing = timezone.make_aware(datetime(2030, 1, 7, 9, 0))
+        Appointment.objects.create(customer=self.customer, date_time=existing, time=existing.time())
+
+    def write_csv(self, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'appointments.csv')
+        with open(path, 'w') as source:
+            source.write(content)
+        return path
+
+    def rejected(self, path):
+        with open(path + '.rejects.csv') as rejects:
+            return [row['reason'] for row in csv.DictReader(rejects)]
+
+    def test_import_with_rejects(self):
+        path = self.write_csv(
+            'username,date_time,status\n'
+            'customer,2030-01-07T10:00,scheduled\n'
+            'customer,2030-01-07T10:00,scheduled\n'
+            'customer,2030-01-07T09:00,scheduled\n'
+            'nobody,2030-01-07T11:00,scheduled\n'
+            'customer,not a date,scheduled\n'
+            'customer,2030-01-07T12:00,canceled\n'
+        )
+
+        call_command('import_appointments', path, '--chunk-size', '2', stdout=StringIO())
+
+        self.assertEqual(Appointment.objects.count(), 3)
+        self.assertEqual(AppointmentChange.objects.filter(action='create').count(), 3)
+        self.assertEqual(
+            self.rejected(path), ['slot already booked', 'slot already booked', "unknown customer 'nobody'", "invalid date/time 'not a date'"],
+        )
+
+    def test_slot_booked_after_the_check_rejects_only_its_row(self):
+        path = self.write_csv(
+            'username,date_time\n'
+            'customer,2030-01-07T08:00\n'
+            'customer,2030-01-07T09:00\n'
+            'customer,2030-01-07T10:00\n'
+        )
+
+        # The existing booking is missed by the in-memory check, as if it was made while the chunk was validated
+        with mock.patch.object(Appointment.objects, 'filter', return_value=Appointment.objects.none()):
+            call_command('import_appointments', path, stdout=StringIO())
+
+        self.assertEqual(Appointment.objects.count(), 3)
+        # The existing booking's entry and one for each imported row
+        self.assertEqual(AppointmentChange.objects.filter(action='create').count(), 3)
+        self.assertEqual(self.rejected(path), ['slot already booked'])
+
+    def test_local_times_skipped_by_dst_collide(self):
+        # Clocks in Jerusalem go from 02:00 to 03:00 on 2030-03-29, so both rows are the same instant
+        path = self.write_csv('username,date_time\ncustomer,2030-03-29T02:00\ncustomer,2030-03-29T03:00\n')
+        call_command('import_appointments', path, stdout=StringIO())
+        self.assertEqual(self.rejected(path), ['slot already booked'])
+
+
+class NextAvailableTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.customer = get_user_model().objects.create_user(username='customer', password='testpass', user_type='customer')
+        BusinessHours.objects.create(**{f'{day}_close_time': '10:00' for day, _ in BusinessHours.DAYS_OF_WEEK})
+        self.business_hours = BusinessHours.objects.first()
+        self.start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time()))
+
+    def book(self, day, hour):
+        slot = self.start + timedelta(days=day, hours=hour)
+        Appointment.objects.create(customer=self.customer, date_time=slot, time=slot.time())
+
+    def test_skips_fully_booked_days(self):
+        for day in range(40):
+            self.book(day, 8)
+            self.book(day, 9)
+        self.book(40, 8)
+        with self.assertNumQueries(4):
+            slots = self.business_hours.next_available_slots(self.start, 2)
+        self.assertEqual(slots, [self.start + timedelta(days=40, hours=9), self.start + timedelta(days=41, hours=8)])
+
+    def test_off_grid_bookings_do_not_fill_a_day(self):
+        self.book(0, 8)
+        self.book(0, 8.5)
+        slots = self.business_hours.next_available_slots(self.start, 1)
+        self.assertEqual(slots, [self.start + timedelta(hours=9)])
+
+    def test_search_is_bounded_by_the_query_budget(self):
+        windows = BusinessHours.NEXT_AVAILABLE_MAX_WINDOWS
+        window_days = BusinessHours.NEXT_AVAILABLE_WINDOW_DAYS
+        # One free slot per window, so every window runs all of its queries
+        for day in range(windows * window_days + 5):
+            self.book(day, 8)
+            if day % window_days:
+                self.book(day, 9)
+
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('next_available'), {'from': self.start.isoformat(), 'count': 10})
+        self.assertEqual(len(response.json()['slots']), windows)
+        self.assertWithinQueryBudget(response)
+
+    def test_endpoint(self):
+        self.book(0, 8)
+        response = self.client.get(reverse('next_available'), {'from': self.start.isoformat(), 'count': 1})
+        expected = timezone.localtime(self.start + timedelta(hours=9))
+        self.assertEqual(response.json(), {'slots': [{'date': expected.strftime('%Y-%m-%d'), 'time': '09:00'}]})
+
+
+class GenerateFixturesCommandTestCase(TestCase):
+    def snapshot(self):
+        return list(Appointment.objects.order_by('id').values_list('customer__username', 'date_time', 'status'))
+
+    def test_generates_distinct_slots(self):
+        call_command('generate_fixtures', '--customers', '5', '--appointments', '200', '--batch-size', '64', '--raw', stdout=StringIO())
+
+        self.assertEqual(get_user_model().objects.filter(user_type='customer').count(), 5)
+        self.assertEqual(Appointment.objects.values('date_time').distinct().count(), 200)
+        self.assertTrue(Appointment.reminder_options.through.objects.exists())
+        self.assertFalse(get_user_model().objects.first().has_usable_password())
+
+    def test_seed_is_reproducible(self):
+        call_command('generate_fixtures', '--customers', '3', '--appointments', '50', '--seed', '7', stdout=StringIO())
+        first = self.snapshot()
+        Appointment.objects.all().delete()
+        get_user_model().objects.all().delete()
+        call_command('generate_fixtures', '--customers', '3', '--appointments', '50', '--seed', '7', '--raw', stdout=StringIO())
+        self.assertEqual(self.snapshot(), first)
+
+    def test_generated_rows_follow_existing_ones(self):
+        User = get_user_model()
+        existing = User.objects.create_user(username='customer-7', password='testpass', user_type='customer')
+        archived = timezone.now() - timedelta(days=800)
+        AppointmentArchive.objects.create(id=1000, customer=existing, date_time=archived, time=archived.time())
+
+        generated = synthetic.generate(2, 20)
+
+        customers = User.objects.filter(pk__in=generated['customer_ids'])
+        self.assertEqual(sorted(customers.values_list('username', flat=True)), ['customer-8', 'customer-9'])
+        self.assertGreater(Appointment.objects.order_by('id').first().id, 1000)
+        booked = User.objects.filter(pk__in=Appointment.objects.values('customer_id'))
+        self.assertTrue(booked.exists())
+        self.assertFalse(booked.filter(schedule_version=0).exists())
+
+
+class SimulateBookingLoadTestCase(TestCase):
+    def test_count_double_bookings(self):
+        customer = get_user_model().objects.create_user(username='customer', password='testpass', user_type='customer')
+        slot = timezone.now() + timedelta(days=1)
+        first = Appointment.objects.create(customer=customer, date_time=slot, time=slot.time())
+        first.delete()
+        second = Appointment.objects.create(customer=customer, date_time=slot, time=slot.time())
+        self.assertEqual(count_double_bookings(0), 0)
+
+        # unique_scheduled_slot now rejects a live duplicate, so only its log entry can be replayed
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Appointment.objects.create(customer=customer, date_time=slot, time=slot.time())
+        AppointmentChange.record(second, 'create')
+        self.assertEqual(count_double_bookings(0), 1)
+
+
+class QueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        generated = synthetic.generate(5, 300, first_day=timezone.localdate() - timedelta(days=20))
+        self.customer = get_user_model().objects.get(pk=generated['customer_ids'][0])
+        self.owner = get_user_model().objects.create_user(username='owner', password='testpass', user_type='owner')
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('home'))
+        self.assertRegex(response['Server-Timing'], r'^db;desc="\d+ queries";dur=[\d.]+, app;dur=[\d.]+$')
+
+    def test_customer_views(self):
+        self.customer.receive_reminders = True
+        self.customer.save()
+        option = ReminderOption.objects.create(name='Email')
+        self.client.force_login(self.customer)
+        # The first visit also creates the calendar token, the second is served from the fragment cache
+        self.assertWithinQueryBudget(self.client.get(reverse('dashboard')))
+        self.assertWithinQueryBudget(self.client.get(reverse('dashboard')))
+        self.assertWithinQueryBudget(self.client.get(
+            reverse('get_available_hours'), {'selected_date': self.tomorrow.isoformat()}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        ))
+        self.assertWithinQueryBudget(self.client.get(reverse('next_available')))
+
+        slot = timezone.make_aware(datetime.combine(self.tomorrow + timedelta(days=30), datetime.min.time())) + timedelta(hours=8)
+        data = {'date_time_year': slot.year, 'date_time_month': slot.month, 'date_time_day': slot.day, 'time': '08:00'}
+        # A booking with a reminder, through the idempotency check, then a rejected one for the taken slot
+        self.assertWithinQueryBudget(self.client.post(
+            reverse('dashboard'), dict(data, reminder_options=[option.pk]), HTTP_IDEMPOTENCY_KEY='budget',
+        ))
+        self.assertWithinQueryBudget(self.client.post(reverse('dashboard'), data))
+        self.assertWithinQueryBudget(self.client.post(reverse('dashboard'), dict(data, time='08:30')))
+
+        appointment = Appointment.objects.get(date_time=slot)
+        self.assertWithinQueryBudget(self.client.post(reverse('cancel_appointment', args=[appointment.pk])))
+
+    def test_owner_views(self):
+        self.client.force_login(self.owner)
+        self.assertWithinQueryBudget(self.client.get(reverse('owner_dashboard')))
+        self.assertWithinQueryBudget(self.client.post(reverse('owner_dashboard'), {
+            f'{day}_{edge}_time': f'{hour:02d}:00' for day, _ in BusinessHours.DAYS_OF_WEEK for edge, hour in (('open', 8), ('close', 17))
+        }))
+        self.assertWithinQueryBudget(self.client.get(reverse('get_appointments')))
+        archive_appointments(timezone.now() - timedelta(days=10))
+        self.assertWithinQueryBudget(self.client.get(reverse('get_appointments'), {'start': '2000-01-01'}))
+
+        # Without business hours the dashboard creates them, and renders its list uncached
+        BusinessHours.objects.all().delete()
+        cache.clear()
+        self.assertWithinQueryBudget(self.client.get(reverse('owner_dashboard')))
+
+
+class SlowQueryLogTestCase(TestCase):
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql("SELECT  id FROM t WHERE name = 'x''y' AND id IN (%s, %s, %s) LIMIT 21"),
+            'SELECT id FROM t WHERE name = ? AND id IN (...) LIMIT ?',
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_logs_call_site_and_redacts_params(self):
+        self.client.force_login(get_user_model().objects.create_user(username='owner', password='testpass', user_type='owner'))
+        with self.assertLogs('appointments.slow_queries') as logs:
+            self.client.get(reverse('owner_dashboard'))
+
+        entries = [record.slow_query for record in logs.records]
+        self.assertIn('appointments/views.py', ' '.join(entry['call_site'] for entry in entries))
+        session_query = next(entry for entry in entries if 'django_session' in entry['sql'])
+        self.assertTrue(all(param.startswith('<str:') for param in session_query['params']))
+
+    def test_log_directory_is_created_with_the_first_record(self):
+        path = os.path.join(output_directory.name, 'nested', 'slow.log')
+        with self.settings(SLOW_QUERY_LOG=path):
+            handler = SettingFileHandler('SLOW_QUERY_LOG')
+            self.assertFalse(os.path.exists(os.path.dirname(path)))
+            handler.emit(logging.makeLogRecord({'msg': 'slow'}))
+            handler.close()
+        with open(path) as log:
+            self.assertEqual(log.read(), 'slow\n')
+
+    def test_summary_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'slow.log')
+            with open(path + '.1', 'w') as log:
+                log.write('{"duration_ms": 120, "fingerprint": "a", "sql": "SELECT ?", "call_site": "views.py:1 in v"}\n')
+            with open(path, 'w') as log:
+                log.write('{"duration_ms": 300, "fingerprint": "a", "sql": "SELECT ?", "call_site": "views.py:1 in v"}\n')
+                log.write('{"duration_ms": 200, "fingerprint": "b", "sql": "UPDATE ?", "call_site": "models.py:2 in m"}\n')
+                log.write('not json\n')
+            out = StringIO()
+            call_command('slow_queries', '--path', path, stdout=out, stderr=StringIO())
+
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[1].startswith('a ') and ' 2 ' in lines[1])
+        self.assertIn('2 x views.py:1 in v', out.getvalue())
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        self.staff = get_user_model().objects.create_user(username='staff', password='testpass', user_type='owner', is_staff=True)
+
+    def test_staff_profile_and_hottest_functions(self):
+        self.client.force_login(self.staff)
+        with self.settings(PROFILE_DIR=self.profile_dir.name):
+            self.assertNotIn('X-Profile-Id', self.client.get(reverse('owner_dashboard')))
+            request_id = self.client.get(reverse('owner_dashboard'), {'profile': '1'})['X-Profile-Id']
+
+            self.assertContains(self.client.get(reverse('profiles')), request_id)
+            response = self.client.get(reverse('profile_detail', args=[request_id]), {'sort': 'cumtime'})
+            self.assertContains(response, 'owner_dashboard')
+            self.assertEqual(self.client.get(reverse('profile_detail', args=['..etc'])).status_code, 404)
+
+    def test_signed_header_and_lru_eviction(self):
+        with self.settings(PROFILE_DIR=self.profile_dir.name, PROFILE_STORAGE_MAX_BYTES=1):
+            self.assertNotIn('X-Profile-Id', self.client.get(reverse('home'), HTTP_X_PROFILE='forged'))
+            first = self.client.get(reverse('home'), HTTP_X_PROFILE=make_profile_token())['X-Profile-Id']
+            self.assertFalse(os.path.exists(os.path.join(self.profile_dir.name, f'{first}.prof')))
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.metrics_dir.cleanup)
+
+    def test_endpoint_merges_worker_files(self):
+        with self.settings(METRICS_DIR=self.metrics_dir.name):
+            # Another worker's totals
+            with open(os.path.join(self.metrics_dir.name, 'other.json'), 'w') as worker:
+                worker.write('{"counters": {"appointments_email_send_failures_total": 2}, "histograms": {}}')
+            metrics.inc('appointments_email_send_failures_total')
+            self.client.get(reverse('home'))
+
+            body = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('# TYPE appointments_http_request_duration_seconds histogram', body)
+        self.assertRegex(body, r'appointments_http_requests_total\{method="GET",status="200",view="home"\} \d+')
+        self.assertRegex(body, r'appointments_http_request_duration_seconds_bucket\{le="\+Inf",view="home"\} \d+')
+        self.assertRegex(body, r'appointments_db_queries_total\{view="home"\} \d+')
+        self.assertRegex(body, r'appointments_email_send_failures_total [3-9]')
+
+    def test_cache_hits_and_token(self):
+        cache = metrics.LocMemCache('metrics-test', {})
+        cache.set('key', None)
+        self.assertIsNone(cache.get('key', 'default'))
+        self.assertEqual(cache.get('missing', 'default'), 'default')
+        counters = metrics.snapshot()['counters']
+        self.assertGreaterEqual(counters['appointments_cache_requests_total{cache="metrics-test",result="hit"}'], 1)
+        self.assertGreaterEqual(counters['appointments_cache_requests_total{cache="metrics-test",result="miss"}'], 1)
+
+        with self.settings(METRICS_DIR=self.metrics_dir.name, METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_histogram_series_are_grouped_in_bucket_order(self):
+        name = 'appointments_http_request_duration_seconds'
+        histograms = {
+            f'{name}{{view="b"}}': [1] + [0] * 11 + [0.001],
+            f'{name}{{view="a"}}': [0] * 11 + [1, 20.0],
+        }
+        lines = [line for line in metrics.render({'counters': {}, 'histograms': histograms}).splitlines() if line.startswith(name)]
+        self.assertEqual(len(lines), 2 * 14)
+        self.assertEqual(lines[0], f'{name}_bucket{{le="0.005",view="a"}} 0')
+        self.assertEqual(lines[10], f'{name}_bucket{{le="10.0",view="a"}} 0')
+        self.assertEqual(lines[11], f'{name}_bucket{{le="+Inf",view="a"}} 1')
+        self.assertEqual(lines[13], f'{name}_count{{view="a"}} 1')
+        self.assertTrue(all('view="b"' in line for line in lines[14:]))
+
+    def test_concurrent_flushes_write_one_file(self):
+        metrics.inc('appointments_email_send_failures_total')
+        barrier = threading.Barrier(8)
+        errors = []
+
+        def flush():
+            barrier.wait()
+            try:
+                metrics.flush(blocking=False)
+                metrics.flush()
+            except Exception as error:
+                errors.append(error)
+
+        with self.settings(METRICS_DIR=self.metrics_dir.name):
+            threads = [threading.Thread(target=flush) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        files = os.listdir(self.metrics_dir.name)
+        self.assertEqual(len(files), 1)
+        with open(os.path.join(self.metrics_dir.name, files[0])) as worker:
+            self.assertIn('appointments_email_send_failures_total', json.load(worker)['counters'])
+
+    def test_failed_flush_does_not_raise(self):
+        with self.settings(METRICS_DIR=self.metrics_dir.name), mock.patch('os.replace', side_effect=OSError):
+            with self.assertLogs('appointments.metrics', 'WARNING'):
+                self.assertFalse(metrics.flush())
+
+
+class TracingTestCase(TestCase):
+    def setUp(self):
+        BusinessHours.objects.create()
+        self.customer = get_user_model().objects.create_user(
+            username='customer', email='customer@example.com', password='testpass', user_type='customer', receive_reminders=True,
+        )
+        self.client.force_login(self.customer)
+
+    def book(self):
+        day = timezone.localdate() + timedelta(days=7)
+        return self.client.post(reverse('dashboard'), {
+            'date_time_year': day.year, 'date_time_month': day.month, 'date_time_day': day.day, 'time': '10:00',
+            'reminder_options': [ReminderOption.objects.create(name='Email').pk],
+        })
+
+    @override_settings(TRACE_SAMPLE_RATE=1.0)
+    def test_booking_spans(self):
+        with self.assertLogs('appointments.tracing') as logs:
+            response = self.book()
+
+        spans = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual({span['trace_id'] for span in spans}, {response['X-Trace-Id']})
+        by_name = {span['name']: span for span in spans}
+        for name in ('form.construct', 'appointment.save', 'appointment.reminder_options.set', 'email.send', 'db.query'):
+            self.assertIn(name, by_name)
+        # Time choices are only looked up when the form is rendered
+        self.assertNotIn('availability.query', by_name)
+        root = by_name[f'POST {reverse("dashboard")}']
+        self.assertIsNone(root['parent_id'])
+
+        with self.assertLogs('appointments.tracing') as logs:
+            self.client.get(reverse('dashboard'))
+        by_name = {span['name']: span for span in (json.loads(record.getMessage()) for record in logs.records)}
+        self.assertEqual(by_name['availability.query']['parent_id'], by_name['template.render']['span_id'])
+
+    @override_settings(TRACE_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_not_traced(self):
+        self.assertNotIn('X-Trace-Id', self.book())
+
+
+class LoggingTestCase(TestCase):
+    def test_handlers_run_behind_a_queue(self):
+        self.assertTrue(all(isinstance(handler, QueueHandler) for handler in logging.getLogger('appointments').handlers))
+
+    def test_sampling_filter(self):
+        debug = logging.makeLogRecord({'levelno': logging.DEBUG})
+        warning = logging.makeLogRecord({'levelno': logging.WARNING})
+        self.assertFalse(SamplingFilter(rate=0.0).filter(debug))
+        self.assertTrue(SamplingFilter(rate=0.0).filter(warning))
+        self.assertTrue(SamplingFilter(rate=1.0).filter(debug))
+
+    def test_views_logger_samples_only_debug_records(self):
+        sampled, = logging.getLogger('appointments.views').filters
+        self.assertEqual(sampled.max_level, logging.DEBUG)
+        self.assertTrue(sampled.filter(logging.makeLogRecord({'levelno': logging.INFO})))
+
+    def test_queue_handler_defers_formatting(self):
+        records = queue.SimpleQueue()
+        args = ('2030-01-01',)
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.makeLogRecord({'msg': 'Available hours for %s', 'args': args, 'exc_info': sys.exc_info()})
+        DeferredQueueHandler(records).handle(record)
+        queued = records.get_nowait()
+        self.assertEqual((queued.msg, queued.args), ('Available hours for %s', args))
+        self.assertIsNone(queued.exc_text)
+        self.assertIn('ValueError: boom', logging.Formatter().format(queued))
+
+    def test_structured_formatter_appends_extra_fields(self):
+        record = logging.makeLogRecord({'msg': 'Available hours for %s', 'args': ('2030-01-01',), 'slots': 3})
+        self.assertEqual(StructuredFormatter('%(message)s').format(record), "Available hours for 2030-01-01 slots=3")
+
+
+class CustomerDashboardTestCase(TestCase):
+    def setUp(self):
+        BusinessHours.objects.create()
+        self.customer = get_user_model().objects.create_user(username='customer', password='testpass', user_type='customer')
+        self.customer.get_calendar_token()
+        self.client.force_login(self.customer)
+        now = timezone.now()
+
+        def book(days):
+            slot = now.replace(minute=0, second=0, microsecond=0) + timedelta(days=days)
+            return Appointment.objects.create(customer=self.customer, date_time=slot, time=slot.time())
+
+        self.upcoming = book(3)
+        self.recent = book(-10)
+        self.older = [book(-100 - day) for day in range(5)]
+        self.archived = book(-500)
+        archive_appointments(now - timedelta(days=365))
+
+    def test_query_count_does_not_grow_with_history(self):
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual([a.id for a in response.context['future_appointments']], [self.upcoming.id])
+        self.assertEqual([a.id for a in response.context['past_appointments']], [self.recent.id])
+
+    def test_recently_archived_appointments_stay_in_the_history_window(self):
+        archive_appointments(timezone.now() - timedelta(days=5))
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual([a.id for a in response.context['past_appointments']], [self.recent.id])
+
+    def test_appointment_lists_are_cached_until_the_schedule_changes(self):
+        self.client.get(reverse('dashboard'))
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, reverse('cancel_appointment', args=[self.upcoming.id]))
+
+        slot = self.upcoming.date_time + timedelta(days=1)
+        added = Appointment.objects.create(customer=self.customer, date_time=slot, time=slot.time())
+        self.assertContains(self.client.get(reverse('dashboard')), reverse('cancel_appointment', args=[added.id]))
+
+    def test_appointment_later_this_hour_is_upcoming(self):
+        self.client.get(reverse('dashboard'))
+        slot = timezone.now() + timedelta(minutes=10)
+        soon = Appointment.objects.create(customer=self.customer, date_time=slot, time=slot.time())
+        response = self.client.get(reverse('dashboard'))
+        self.assertIn(soon, response.context['future_appointments'])
+        self.assertContains(response, reverse('cancel_appointment', args=[soon.id]))
+
+    def test_history_page_continues_where_the_rendered_list_ends(self):
+        page_one = self.client.get(reverse('dashboard'))
+        recent = date_format(timezone.localtime(self.recent.date_time), 'F j, Y')
+        self.assertContains(page_one, recent)
+
+        # The stored window is gone while the fragment is still cached, and the new window starts later
+        customer = get_user_model().objects.get(pk=self.customer.pk)
+        cache.delete(f'dashboard-lists:{customer.pk}:{customer.schedule_version}:{customer.schedule_changed_at.timestamp()}')
+        with mock.patch('appointments.views.DASHBOARD_HISTORY_DAYS', 5):
+            page_two = self.client.get(reverse('dashboard'))
+        self.assertNotContains(page_two, recent)
+
+        cursor = {'before': page_two.context['history_start'].isoformat()}
+        history = self.client.get(reverse('appointment_history'), cursor).json()
+        self.assertEqual(history['appointments'][0]['id'], self.recent.id)
+
+    def test_history_keyset_pages_reach_the_archive(self):
+        cursor = {'before': self.client.get(reverse('dashboard')).context['history_start'].isoformat()}
+        pages = []
+        with mock.patch('appointments.views.HISTORY_PAGE_SIZE', 2):
+            while cursor and len(pages) < 10:
+                data = self.client.get(reverse('appointment_history'), cursor).json()
+                pages.append([appointment['id'] for appointment in data['appointments']])
+                cursor = data['next']
+
+        expected = [appointment.id for appointment in self.older] + [self.archived.id]
+        self.assertEqual(pages, [expected[0:2], expected[2:4], expected[4:6]])
+        self.assertEqual(self.client.get(reverse('appointment_history'), {'before': 'nope'}).status_code, 400)
+
+
+class AnonymousPageCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_user_model().objects.create_user(username='customer', password='testpass', user_type='customer')
+
+    def test_cached_login_page_gets_a_working_csrf_token(self):
+        self.assertEqual(Client().get(reverse('login'))[PAGE_CACHE_HEADER], 'miss')
+
+        client = Client(enforce_csrf_checks=True)
+        with self.assertNumQueries(0):
+            response = client.get(reverse('login'), {'utm_source': 'campaign'})
+        self.assertEqual(response[PAGE_CACHE_HEADER], 'hit')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertEqual(response['Vary'], 'Cookie')
+        self.assertNotContains(response, '__csrf_token_placeholder__')
+
+        token = response.content.decode().split('name="csrfmiddlewaretoken" value="')[1].split('"')[0]
+        response = client.post(reverse('login'), {'username': 'customer', 'password': 'testpass', 'csrfmiddlewaretoken': token})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_home_is_public_and_sessions_bypass_the_cache(self):
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response[PAGE_CACHE_HEADER], 'hit')
+        self.assertIn('public', response['Cache-Control'])
+
+        self.client.login(username='customer', password='testpass')
+        self.assertNotIn(PAGE_CACHE_HEADER, self.client.get(reverse('register')))
+
+
+class StaticAssetTestCase(TestCase):
+    def setUp(self):
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'appointments.storage.CompressedManifestStaticFilesStorage'},
+        }
+        overridden = self.settings(STATIC_ROOT=static_root.name, STORAGES=storages)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        call_command('collectstatic', interactive=False, verbosity=0, ignore_patterns=['admin'])
+
+    def test_hashed_files_are_precompressed_and_immutable(self):
+        name = staticfiles_storage.stored_name('appointments/styles.css')
+        self.assertNotEqual(name, 'appointments/styles.css')
+
+        response = self.client.get(reverse('static_asset', args=[name]), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        with staticfiles_storage.open(name) as original:
+            self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), original.read())
+
+        response = self.client.get(reverse('static_asset', args=[name]), HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('Content-Disposition', response)
+        self.assertEqual(self.client.get(reverse('static_asset', args=[name + '.gz'])).status_code, 404)
+
+    def test_hashed_names_are_built_once_per_manifest(self):
+        names = hashed_names(staticfiles_storage)
+        self.assertIn(staticfiles_storage.stored_name('appointments/styles.css'), names)
+        self.assertIs(hashed_names(staticfiles_storage), names)
+        staticfiles_storage.hashed_files, _ = staticfiles_storage.load_manifest()
+        self.assertIsNot(hashed_names(staticfiles_storage), names)
+
+    def test_unhashed_files_are_revalidated(self):
+        response = self.client.get(reverse('static_asset', args=['appointments/styles.css']))
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        response = self.client.get(
+            reverse('static_asset', args=['appointments/styles.css']), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(reverse('static_asset', args=['../settings.py'])).status_code, 404)
+
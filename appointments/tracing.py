@@ -0,0 +1,143 @@
+"""
+Tracing Module
+
+
+This module is a minimal tracing API. A trace is started per request by TracingMiddleware, and code marks the
+stages it wants timed with span():
+
+    with tracing.span('appointment.save', appointment_id=appointment.pk):
+        appointment.save()
+
+The current trace and span are kept in context variables, so spans nest without being passed around. Only a
+settings.TRACE_SAMPLE_RATE share of requests is traced; in the others span() does nothing but read a context
+variable. Finished traces are written as one JSON object per span to the 'appointments.tracing' logger, which
+settings.LOGGING sends to a rotating JSON lines file.
+"""
+
+import json
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+_trace = ContextVar('trace', default=None)
+_span = ContextVar('span', default=None)
+
+
+class Trace:
+
+    """
+    The spans recorded for one sampled request.
+    """
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.spans = []
+
+    def export(self):
+        for span in self.spans:
+            logger.info(json.dumps(span, default=str))
+
+
+def current_trace_id():
+
+    """
+    Get the ID of the trace being recorded.
+
+    Returns:
+        str: The trace ID, or None if the current request is not traced.
+    """
+
+    trace = _trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+@contextmanager
+def start_trace(name, sample_rate=None, **attributes):
+
+    """
+    Start a trace with a root span, if it is sampled.
+
+    Parameters:
+        name (str): The root span name, e.g. 'GET /dashboard/'.
+        sample_rate (float): Share of traces to record; settings.TRACE_SAMPLE_RATE by default.
+        **attributes: Attributes of the root span.
+
+    Yields:
+        Trace: The trace, or None if it was not sampled.
+    """
+
+    if sample_rate is None:
+        sample_rate = settings.TRACE_SAMPLE_RATE
+    if _trace.get() is not None or random.random() >= sample_rate:
+        yield None
+        return
+
+    trace = Trace()
+    token = _trace.set(trace)
+    try:
+        with span(name, **attributes):
+            yield trace
+    finally:
+        _trace.reset(token)
+        trace.export()
+
+
+@contextmanager
+def span(name, **attributes):
+
+    """
+    Time a stage of the current trace as a child of the current span.
+
+    Does nothing when there is no sampled trace.
+
+    Parameters:
+        name (str): The stage name, e.g. 'appointment.save'.
+        **attributes: Values describing the stage.
+
+    Yields:
+        dict: The span, whose 'attributes' can still be added to, or None when not tracing.
+    """
+
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _span.get()
+    record = {
+        'trace_id': trace.trace_id,
+        'span_id': uuid.uuid4().hex[:16],
+        'parent_id': parent['span_id'] if parent is not None else None,
+        'name': name,
+        'start': time.time(),
+        'attributes': attributes,
+    }
+    token = _span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception as error:
+        record['error'] = repr(error)
+        raise
+    finally:
+        record['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        _span.reset(token)
+        trace.spans.append(record)
+
+
+def trace_query(execute, sql, params, many, context):
+
+    """
+    Execute wrapper that records every query of a sampled trace as a 'db.query' span.
+    """
+
+    with span('db.query', sql=sql[:500], many=many):
+        return execute(sql, params, many, context)
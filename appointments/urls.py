@@ -19,8 +19,38 @@ urlpatterns = [
 
     path('get_appointments/', views.get_appointments, name='get_appointments'),
 
+    path('appointments/changes/', views.appointment_changes, name='appointment_changes'),
+
+    path('appointments/history/', views.appointment_history_view, name='appointment_history'),
+
+    path('owner_analytics/', views.owner_analytics, name='owner_analytics'),
+
+    path('export/appointments.csv', views.export_appointments_csv, name='export_appointments_csv'),
+
+    path('export/appointments.ics', views.export_appointments_ics, name='export_appointments_ics'),
+
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
+
+    path('reports/', views.request_report, name='request_report'),
+
+    path('reports/<int:report_id>/', views.report_status, name='report_status'),
+
+    path('reports/<int:report_id>/download/', views.download_report, name='download_report'),
+
     path('get_available_hours/', views.get_available_hours, name='get_available_hours'),
 
+    path('next_available/', views.next_available, name='next_available'),
+
+    path('hold_slot/', views.hold_slot, name='hold_slot'),
+
+    path('metrics', views.metrics_view, name='metrics'),
+
+    path('static/<path:path>', views.static_asset, name='static_asset'),
+
+    path('profiles/', views.profiles, name='profiles'),
+
+    path('profiles/<str:request_id>/', views.profile_detail, name='profile_detail'),
+
 
     path('logout/', views.logout_view, name='logout'),
 ]
\ No newline at end of file
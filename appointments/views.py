@@ -7,22 +7,73 @@ and owner dashboard functionalities.
 """
 
 
-from django.http import Http404, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import authenticate, login, get_user_model, logout
 from django.contrib import messages 
 from django.utils import timezone
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.formats import date_format, time_format
+from django.utils.crypto import constant_time_compare
+from django.utils._os import safe_join
+from django.core.exceptions import SuspiciousFileOperation
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.utils.functional import SimpleLazyObject
+from django.conf import settings
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from .forms import LoginForm, RegistrationForm, AppointmentForm, BusinessHoursForm, ReminderSettingsForm
-from datetime import datetime
+from datetime import datetime, timedelta
 from django import forms
-from .models import BusinessHours, Appointment,UserProfile
+from .models import BusinessHours, Appointment,UserProfile, SlotHold, AppointmentChange, ReportJob
+from .idempotency import idempotent
+from .page_cache import anonymous_page_cache
+from .archive import appointment_history, appointments_in_window, stream_appointments
+from .analytics import owner_report
+from . import ical, metrics, tracing
+from .profiling import hottest_functions, list_profiles
+from .storage import ENCODINGS, hashed_names
 from django.template.loader import render_to_string
 from django.core.mail import send_mail
+import csv
 import logging
+import mimetypes
+import os
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of change log entries returned by one appointment_changes call
+CHANGES_PAGE_SIZE = 500
+
+# Maximum number of slots returned by one next_available call
+NEXT_AVAILABLE_MAX_COUNT = 50
+
+# How far back the calendar subscription feed goes, in days
+CALENDAR_FEED_PAST_DAYS = 90
+
+# Default and maximum length of the owner_analytics period, in days
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 366 * 5
+
+# Past appointments returned by owner_dashboard and get_appointments without an explicit start, in days
+APPOINTMENTS_DEFAULT_PAST_DAYS = 30
+
+# Past appointments shown on the customer dashboard, in days; older ones are loaded page by page
+DASHBOARD_HISTORY_DAYS = 90
+HISTORY_PAGE_SIZE = 20
+
+# How long browsers may keep a content-hashed static file, in seconds; its name changes with its content
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# How long the rendered appointment lists of the dashboards are cached, in seconds. The cache keys include the
+# user's schedule_version, which every appointment change bumps, so this only bounds how long unused entries live
+DASHBOARD_FRAGMENT_SECONDS = 60 * 60
+
 def get_available_hours(request):
 
     """
@@ -38,16 +89,18 @@ def get_available_hours(request):
         JsonResponse: JSON response with an error message for invalid requests.
     """
 
-    if request.method == 'GET' and request.is_ajax():
-        selected_date = request.GET.get('selected_date')
-        logger.info(f"Selected date: {selected_date}")
+    if request.method == 'GET' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        selected_date = parse_date(request.GET.get('selected_date') or '')
+
+        if selected_date is None:
+            return JsonResponse({'error': 'Invalid date'}, status=400)
 
         # Retrieve available hours for the selected date
         business_hours = BusinessHours.objects.first()
-        logger.info(f"Business hours: {business_hours}")
 
-        available_hours = business_hours.get_available_hours(selected_date)
-        logger.info(f"Available hours: {available_hours}")
+        customer = request.user if request.user.is_authenticated else None
+        available_hours = business_hours.get_available_hours(selected_date, customer=customer)
+        logger.debug('Available hours for %s: %s', selected_date, available_hours, extra={'slots': len(available_hours)})
 
         return JsonResponse({'available_hours': available_hours})
 
@@ -56,6 +109,95 @@ def get_available_hours(request):
 
 
 
+def next_available(request):
+
+    """
+    Get the earliest free slots.
+
+    Searches forward from the 'from' query parameter (an ISO datetime, default now) across the business hours
+    and returns the first 'count' free slots within the next NEXT_AVAILABLE_WINDOW_DAYS *
+    NEXT_AVAILABLE_MAX_WINDOWS days of BusinessHours.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: JSON response with the free slots as date and time pairs.
+        JsonResponse: JSON response with an error message for invalid parameters.
+    """
+
+    now = timezone.now()
+    try:
+        start = parse_datetime(request.GET.get('from', '')) or now
+        count = int(request.GET.get('count', 5))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid start or count'}, status=400)
+
+    if not 1 <= count <= NEXT_AVAILABLE_MAX_COUNT:
+        return JsonResponse({'error': 'Invalid start or count'}, status=400)
+
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start)
+
+    business_hours = BusinessHours.objects.first()
+    if business_hours is None:
+        return JsonResponse({'slots': []})
+
+    customer = request.user if request.user.is_authenticated else None
+    slots = business_hours.next_available_slots(max(start, now), count, customer=customer)
+
+    return JsonResponse({
+        'slots': [
+            {'date': slot.strftime('%Y-%m-%d'), 'time': slot.strftime('%H:%M')}
+            for slot in (timezone.localtime(slot) for slot in slots)
+        ],
+    })
+
+
+@login_required
+def hold_slot(request):
+
+    """
+    Hold a time slot while the customer completes the booking form.
+
+    Places a short-lived hold on the selected date and time so the slot is not offered to other customers
+    until the hold expires or the appointment is booked.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object containing the selected date and time.
+
+    Returns:
+        JsonResponse: JSON response with the hold expiry time.
+        JsonResponse: JSON response with an error message if the slot is already held or the request is invalid.
+        JsonResponse: 400 if the slot is in the past or not one of the business hours slots of its day, like
+            AppointmentForm.clean() checks, since such a hold would hide nothing.
+    """
+
+    if request.method != 'POST' or request.user.user_type != 'customer':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+
+    selected_date = parse_date(request.POST.get('selected_date') or '')
+    selected_time = parse_time(request.POST.get('time') or '')
+    if selected_date is None or selected_time is None:
+        return JsonResponse({'error': 'Invalid date or time'}, status=400)
+
+    slot = timezone.make_aware(datetime.combine(selected_date, selected_time))
+    if slot <= timezone.now():
+        return JsonResponse({'error': 'Appointments cannot be scheduled in the past.'}, status=400)
+    business_hours = BusinessHours.objects.first()
+    if business_hours is None or selected_time not in business_hours.slot_times()[selected_date.weekday()]:
+        return JsonResponse({'error': 'Invalid appointment time. Please choose a time within business hours.'}, status=400)
+
+    if Appointment.objects.filter(date_time=slot).exists():
+        return JsonResponse({'error': 'This slot is already booked.'}, status=409)
+
+    hold = SlotHold.place(request.user, slot)
+    if hold is None:
+        return JsonResponse({'error': 'This slot is being held by another customer.'}, status=409)
+
+    return JsonResponse({'expires_at': hold.expires_at.isoformat()})
+
+
 def is_valid_appointment_time(appointment_time, open_time, close_time):
 
     """
@@ -80,6 +222,44 @@ def is_valid_appointment_time(appointment_time, open_time, close_time):
     return open_time <= appointment_time <= close_time
 
 
+def parse_window(request, default_past_days=None):
+
+    """
+    Parse the time window of a request.
+
+    Reads the optional 'start' and 'end' query parameters, given either as ISO dates or ISO datetimes
+    (as sent by calendar clients). Missing or malformed bounds are treated as open, except that a missing
+    start defaults to the beginning of the day default_past_days ago when that is given.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+        default_past_days (int): Days of history to include when no start is given, or None for no bound.
+
+    Returns:
+        tuple: The (start, end) datetimes, each timezone-aware or None.
+    """
+
+    bounds = []
+    for name in ('start', 'end'):
+        value = request.GET.get(name, '')
+        try:
+            bound = parse_datetime(value)
+            if bound is None:
+                day = parse_date(value)
+                bound = datetime.combine(day, datetime.min.time()) if day else None
+        except ValueError:
+            bound = None
+        if bound is not None and timezone.is_naive(bound):
+            bound = timezone.make_aware(bound)
+        bounds.append(bound)
+
+    if bounds[0] is None and default_past_days is not None:
+        # Whole days, so the default window and the caches keyed by it only change once a day
+        day = timezone.localdate() - timedelta(days=default_past_days)
+        bounds[0] = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    return tuple(bounds)
+
+
 @login_required
 def save_reminder_settings(request, user_id, appointment_id):
 
@@ -117,6 +297,7 @@ def save_reminder_settings(request, user_id, appointment_id):
 
 
 
+@anonymous_page_cache
 def home(request):
 
     """
@@ -153,6 +334,7 @@ def logout_view(request):
     return redirect('home')
 
 
+@anonymous_page_cache
 def register(request):
 
     """
@@ -216,8 +398,8 @@ def register(request):
         else:
             # Clear the form data to prevent retaining previous values
             form.data = {}
-            # Print form errors for debugging
-            print(f"Form errors: {form.errors}")
+            # Log which fields failed, not their values
+            logger.info('Registration rejected, invalid fields: %s', list(form.errors), extra={'path': request.path})
 
             # Handle form errors, maybe display them in the template
             return render(request, 'appointments/register.html', {'form': form})
@@ -228,6 +410,7 @@ def register(request):
     return render(request, 'appointments/register.html', {'form': form})
 
 @login_required
+@idempotent
 def dashboard(request):
 
     """
@@ -235,6 +418,15 @@ def dashboard(request):
 
     Renders the dashboard page for authenticated users based on their user type.
 
+    The customer's upcoming appointments and the last DASHBOARD_HISTORY_DAYS of past ones are read in one
+    ordered window; older history is loaded on demand from appointment_history. A GET therefore runs a fixed
+    number of queries however long the customer's history: session, user, business hours, the archive horizon,
+    appointments (plus archived ones when the archive reaches into the window), and the two availability
+    queries of the booking form (plus one the first time the calendar token is created).
+
+    The rendered appointment lists are cached under the customer's schedule_version and the start of their next
+    appointment (see customer_dashboard_lists), so while nothing changes a GET skips the appointments query.
+
     Parameters:
         request (HttpRequest): The HTTP request object.
 
@@ -250,73 +442,165 @@ def dashboard(request):
         business_hours = BusinessHours.objects.first()
         current_time = timezone.now()
 
-        # Get future appointments
-        future_appointments = Appointment.objects.filter(customer=user, date_time__gte=current_time)
-
-        # Get past appointments
-        past_appointments = Appointment.objects.filter(customer=user, date_time__lt=current_time)
-
         if request.method == 'POST':
-            form = AppointmentForm(request.POST, business_hours=business_hours)  # Pass business_hours here
+            with tracing.span('form.construct'):
+                form = AppointmentForm(request.POST, business_hours=business_hours, customer=user)  # Pass business_hours here
 
+            # The form checks the slot is on the business hours grid and free, see AppointmentForm.clean()
+            booked = False
             if form.is_valid():
                 appointment = form.save(commit=False)
                 appointment.customer = user
-                selected_date = form.cleaned_data['date_time']
-                selected_time = form.cleaned_data['time']
-                appointment.date_time = datetime.combine(selected_date, selected_time)
-
-                if Appointment.objects.filter(date_time=appointment.date_time).exists():
-                    messages.error(
-                        request, 'An appointment already exists at the selected date and time.'
-                    )
-                else:
-                    open_time = getattr(business_hours, f"{selected_date.strftime('%A').lower()}_open_time")
-                    close_time = getattr(business_hours, f"{selected_date.strftime('%A').lower()}_close_time")
-
-                    if not is_valid_appointment_time(selected_time, open_time, close_time):
-                        messages.error(
-                            request,
-                            'Invalid appointment time. Please choose a time within business hours.',
-                        )
-                    else:
+                try:
+                    with tracing.span('appointment.save'):
                         appointment.save()
-                        # Handle reminder options
-                        reminder_options = form.cleaned_data['reminder_options']
+                    booked = True
+                except IntegrityError:
+                    # Another customer booked the slot after the form checked it; see unique_scheduled_slot
+                    form.add_error(None, 'An appointment already exists at the selected date and time.')
+
+            if booked:
+                # The customer's hold on this slot is consumed by the booking
+                SlotHold.objects.filter(customer=user, date_time=appointment.date_time).delete()
+                # Handle reminder options; a new appointment has none to replace
+                reminder_options = form.cleaned_data['reminder_options']
+                if reminder_options:
+                    with tracing.span('appointment.reminder_options.set', count=len(reminder_options)):
                         appointment.reminder_options.set(reminder_options)
 
-                        if user.receive_reminders:
-                            # Assuming you have a function to send reminders via email
-                            send_appointment_reminder(user, appointment)
+                if user.receive_reminders:
+                    # Assuming you have a function to send reminders via email
+                    send_appointment_reminder(user, appointment)
 
-                            messages.success(request, 'Appointment scheduled successfully, and reminder sent.')
-                        else:
-                            messages.success(request, 'Appointment scheduled successfully.')
+                    messages.success(request, 'Appointment scheduled successfully, and reminder sent.')
+                else:
+                    messages.success(request, 'Appointment scheduled successfully.')
 
-                        return redirect('dashboard')
+                return redirect('dashboard')
+            elif form.non_field_errors():
+                for error in form.non_field_errors():
+                    messages.error(request, error)
             else:
                 messages.error(
                     request, 'Failed to schedule appointment. Please correct the errors below.'
                 )
         else:
-            form = AppointmentForm(initial={'date_time': current_time}, business_hours=business_hours)  # Pass business_hours here
+            with tracing.span('form.construct'):
+                form = AppointmentForm(initial={'date_time': current_time}, business_hours=business_hours, customer=user)  # Pass business_hours here
             form.fields['date_time'].widget = forms.SelectDateWidget(
                 years=range(current_time.year, current_time.year + 2)
             )
 
-        return render(
-            request, 'appointments/dashboard.html', {
-                'form': form,
-                'business_hours': business_hours,
-                'future_appointments': future_appointments,
-                'past_appointments': past_appointments
-            }
-        )
+        lists = customer_dashboard_lists(user, current_time)
+
+        with tracing.span('template.render', template='appointments/dashboard.html'):
+            return render(
+                request, 'appointments/dashboard.html', {
+                    'form': form,
+                    'business_hours': business_hours,
+                    'calendar_url': request.build_absolute_uri(reverse('calendar_feed', args=[user.get_calendar_token()])),
+                    'fragment_seconds': DASHBOARD_FRAGMENT_SECONDS,
+                    **lists,
+                }
+            )
     else:
         messages.error(request, 'Invalid user type. You do not have permission to access this page.')
         return redirect('login')
 
 
+def customer_dashboard_lists(user, current_time):
+
+    """
+    Get the customer dashboard's appointment lists and the values their cached fragment is keyed by.
+
+    Upcoming appointments and the last DASHBOARD_HISTORY_DAYS of past ones, archived or not, are read in one
+    ordered window and split at the current time. Between schedule changes the split only moves when the next upcoming
+    appointment starts, so that appointment's date_time ('list_until') and the history window are kept in the
+    cache: while the current time has not passed list_until, the lists are lazy and a cached fragment means
+    they are never read.
+
+    Parameters:
+        user (UserProfile): The customer.
+        current_time (datetime): The current time.
+
+    Returns:
+        dict: history_start, list_until (None when nothing is upcoming), future_appointments and
+            past_appointments.
+    """
+
+    # schedule_changed_at tells apart users that reused a pk
+    key = f'dashboard-lists:{user.pk}:{user.schedule_version}:{user.schedule_changed_at.timestamp()}'
+    window = cache.get(key)
+
+    def load():
+        # The archive is only read when archive_appointments has run with a cutoff inside the history window
+        return appointments_in_window(history_start, None, customer=user)
+
+    if window is not None and (window[1] is None or current_time <= window[1]):
+        history_start, list_until = window
+        appointments = SimpleLazyObject(load)
+    else:
+        history_start = current_time - timedelta(days=DASHBOARD_HISTORY_DAYS)
+        appointments = load()
+        list_until = next((appointment.date_time for appointment in appointments if appointment.date_time >= current_time), None)
+        cache.set(key, (history_start, list_until), DASHBOARD_FRAGMENT_SECONDS)
+
+    return {
+        'history_start': history_start,
+        'list_until': list_until,
+        'future_appointments': SimpleLazyObject(
+            lambda: [appointment for appointment in appointments if appointment.date_time >= current_time]
+        ),
+        'past_appointments': SimpleLazyObject(
+            lambda: [appointment for appointment in reversed(appointments) if appointment.date_time < current_time]
+        ),
+    }
+
+
+@login_required
+def appointment_history_view(request):
+
+    """
+    Get a page of the customer's older appointments for the dashboard's "load more" button.
+
+    Pages are keyset paginated: pass the 'before' and 'before_id' values of the previous response's 'next' to
+    get the following page. The first page starts at the dashboard's history_start.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object. 'before' is an ISO datetime, 'before_id' an optional
+            appointment id.
+
+    Returns:
+        JsonResponse: Up to HISTORY_PAGE_SIZE appointments, newest first, and the 'next' cursor or null.
+        JsonResponse: 400 if 'before' or 'before_id' is invalid.
+    """
+
+    before = parse_datetime(request.GET.get('before') or '')
+    before_id = request.GET.get('before_id')
+    if before is None or (before_id and not before_id.isdigit()):
+        return JsonResponse({'error': 'Invalid before or before_id'}, status=400)
+    if timezone.is_naive(before):
+        before = timezone.make_aware(before)
+
+    rows, has_more = appointment_history(request.user, before, int(before_id) if before_id else None, HISTORY_PAGE_SIZE)
+
+    appointments = []
+    for appointment_id, date_time, status in rows:
+        local = timezone.localtime(date_time)
+        appointments.append({
+            'id': appointment_id,
+            'date': date_format(local, 'F j, Y'),
+            'time': time_format(local, 'g:i A'),
+            'status': status,
+        })
+
+    next_page = None
+    if has_more:
+        next_page = {'before': rows[-1][1].isoformat(), 'before_id': rows[-1][0]}
+
+    return JsonResponse({'appointments': appointments, 'next': next_page})
+
+
 def send_appointment_reminder(user, appointment):
 
     """
@@ -336,7 +620,8 @@ def send_appointment_reminder(user, appointment):
     message = f'Your appointment is scheduled for {appointment.date_time}.'
     recipient_list = [user.email]
 
-    send_mail(subject, message, from_email=None, recipient_list=recipient_list)
+    with tracing.span('email.send', subject=subject):
+        send_mail(subject, message, from_email=None, recipient_list=recipient_list)
 
 
 @login_required
@@ -345,7 +630,11 @@ def owner_dashboard(request):
     """
     Render the owner dashboard.
 
-    Renders the owner dashboard page with all appointments and business hours.
+    Renders the owner dashboard page with the appointments and business hours. Appointments from before
+    APPOINTMENTS_DEFAULT_PAST_DAYS days ago are only shown when an earlier 'start' is given.
+
+    The rendered appointment list is cached under the owner's schedule_version, which every appointment
+    change bumps, and the appointments are only read on a cache miss.
 
     Parameters:
         request (HttpRequest): The HTTP request object.
@@ -356,9 +645,9 @@ def owner_dashboard(request):
     """
 
     if request.user.user_type == 'owner':
-        # Fetch all appointments for all users
-        appointments = Appointment.objects.all()
-        print(appointments)
+        # Fetch the appointments of all users in the requested window; older ones only when asked for
+        start, end = parse_window(request, default_past_days=APPOINTMENTS_DEFAULT_PAST_DAYS)
+        appointments = SimpleLazyObject(lambda: appointments_in_window(start, end))
 
         # Fetch or create the business hours for the current owner with defaults
         business_hours, created = BusinessHours.objects.get_or_create()
@@ -379,12 +668,20 @@ def owner_dashboard(request):
         if created:
             messages.warning(request, 'Business hours not set yet. Please set business hours.')
 
-        return render(request, 'appointments/owner_dashboard.html', {'appointments': appointments, 'form': form, 'business_hours': business_hours})
+        return render(request, 'appointments/owner_dashboard.html', {
+            'appointments': appointments,
+            'form': form,
+            'business_hours': business_hours,
+            'window': (start, end),
+            'window_start': start,
+            'fragment_seconds': DASHBOARD_FRAGMENT_SECONDS,
+        })
     else:
         messages.error(request, 'You do not have permission to access this page.')
         return redirect('home')
 
 
+@idempotent
 def cancel_appointment(request, appointment_id):
     """
     Cancel an appointment.
@@ -472,6 +769,7 @@ def send_appointment_cancellation_email(customer_email, appointment_details):
     send_mail(subject, message, from_email=None, recipient_list=recipient_list)
 
 
+@anonymous_page_cache
 def login_view(request):
 
     """
@@ -523,7 +821,8 @@ def get_appointments(request):
     """
     Get all appointments.
 
-    Retrieves all appointments and formats them as JSON.
+    Retrieves the appointments in the window given by the 'start' and 'end' query parameters and formats
+    them as JSON. Without a start, the window begins APPOINTMENTS_DEFAULT_PAST_DAYS days ago.
 
     Parameters:
         request (HttpRequest): The HTTP request object.
@@ -532,8 +831,9 @@ def get_appointments(request):
         JsonResponse: JSON response with a list of all appointments.
     """
 
-    # Fetch all appointments
-    appointments = Appointment.objects.all()
+    # Fetch the appointments in the requested window; older ones only when asked for
+    start, end = parse_window(request, default_past_days=APPOINTMENTS_DEFAULT_PAST_DAYS)
+    appointments = appointments_in_window(start, end)
 
     # Format appointments
     appointments_list = []
@@ -546,4 +846,485 @@ def get_appointments(request):
         }
         appointments_list.append(appointment_info)
 
-    return JsonResponse({'appointments': appointments_list})
\ No newline at end of file
+    return JsonResponse({'appointments': appointments_list})
+
+
+@login_required
+def appointment_changes(request):
+
+    """
+    Get appointment changes since a cursor.
+
+    Returns the appointment change log entries recorded after the given sequence number, so clients that
+    mirror the schedule only fetch what changed since their last sync. Owners see every change,
+    customers only changes to their own appointments.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object with the optional 'since' cursor and 'limit'.
+
+    Returns:
+        JsonResponse: JSON response with the changes, the cursor to send next time and whether more changes are pending.
+        JsonResponse: JSON response with an error message for an invalid cursor or limit.
+    """
+
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = min(int(request.GET.get('limit', CHANGES_PAGE_SIZE)), CHANGES_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+
+    if since < 0 or limit < 1:
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+
+    changes = AppointmentChange.objects.filter(id__gt=since)
+    if request.user.user_type != 'owner':
+        changes = changes.filter(customer=request.user)
+
+    # Fetch one extra row to know whether another page is waiting
+    rows = list(
+        changes.order_by('id').values(
+            'id', 'appointment_id', 'action', 'customer__username', 'date_time', 'status', 'changed_at'
+        )[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changes_list = [
+        {
+            'seq': row['id'],
+            'appointment_id': row['appointment_id'],
+            'action': row['action'],
+            'customer': row['customer__username'],
+            'date_time': row['date_time'].strftime('%Y-%m-%dT%H:%M:%S'),
+            'status': row['status'],
+            'changed_at': row['changed_at'].isoformat(),
+        }
+        for row in rows
+    ]
+
+    return JsonResponse({
+        'changes': changes_list,
+        'next_cursor': rows[-1]['id'] if rows else since,
+        'has_more': has_more,
+    })
+
+
+@login_required
+def owner_analytics(request):
+
+    """
+    Get the owner utilization report.
+
+    Returns bookings per day, the cancellation rate and the weekday/hour utilization heatmap for the
+    period given by the 'start' and 'end' query parameters (ISO dates, both inclusive). The period
+    defaults to the last ANALYTICS_DEFAULT_DAYS days.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: JSON response with the report.
+        JsonResponse: JSON response with an error message if the user is not an owner or the period is invalid.
+    """
+
+    if request.user.user_type != 'owner':
+        return JsonResponse({'error': 'You do not have permission to access this page.'}, status=403)
+
+    today = timezone.localdate()
+    try:
+        end_date = parse_date(request.GET.get('end', '')) or today
+        start_date = parse_date(request.GET.get('start', '')) or end_date - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid period'}, status=400)
+
+    if start_date > end_date or (end_date - start_date).days >= ANALYTICS_MAX_DAYS:
+        return JsonResponse({'error': 'Invalid period'}, status=400)
+
+    business_hours = BusinessHours.objects.first()
+    if business_hours is None:
+        return JsonResponse({'error': 'Business hours not set yet.'}, status=404)
+
+    return JsonResponse(owner_report(start_date, end_date, business_hours))
+
+
+@login_required
+def request_report(request):
+
+    """
+    Queue a PDF report.
+
+    Creates a report job for the kind ('schedule' or 'activity') and period ('start' and 'end', ISO dates)
+    posted by the owner. The report is rendered in the background by the run_report_worker command.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object containing the report kind and period.
+
+    Returns:
+        JsonResponse: JSON response with the job ID and its status URL.
+        JsonResponse: JSON response with an error message if the user is not an owner or the request is invalid.
+    """
+
+    if request.user.user_type != 'owner':
+        return JsonResponse({'error': 'You do not have permission to access this page.'}, status=403)
+
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+
+    kind = request.POST.get('kind')
+    try:
+        period_start = parse_date(request.POST.get('start', ''))
+        period_end = parse_date(request.POST.get('end', ''))
+    except ValueError:
+        period_start = period_end = None
+
+    if kind not in dict(ReportJob.KIND_CHOICES) or period_start is None or period_end is None or period_start > period_end:
+        return JsonResponse({'error': 'Invalid report kind or period'}, status=400)
+
+    job = ReportJob.objects.create(owner=request.user, kind=kind, period_start=period_start, period_end=period_end)
+
+    return JsonResponse({'id': job.id, 'status': job.status, 'status_url': reverse('report_status', args=[job.id])}, status=202)
+
+
+@login_required
+def report_status(request, report_id):
+
+    """
+    Get the status of a report job.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+        report_id (int): The ID of the report job.
+
+    Returns:
+        JsonResponse: JSON response with the job status, and the download URL once the report is ready.
+        Http404: Raises a 404 error if the report does not exist or belongs to another owner.
+    """
+
+    job = get_object_or_404(ReportJob, pk=report_id, owner=request.user)
+
+    data = {'id': job.id, 'kind': job.kind, 'status': job.status}
+    if job.status == 'done':
+        data['download_url'] = reverse('download_report', args=[job.id])
+    elif job.status == 'failed':
+        data['error'] = 'The report could not be generated.'
+
+    return JsonResponse(data)
+
+
+@login_required
+def download_report(request, report_id):
+
+    """
+    Download a finished report.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+        report_id (int): The ID of the report job.
+
+    Returns:
+        FileResponse: The PDF file as an attachment.
+        Http404: Raises a 404 error if the report does not exist, belongs to another owner or is not ready.
+    """
+
+    job = get_object_or_404(ReportJob, pk=report_id, owner=request.user, status='done')
+
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name), content_type='application/pdf')
+
+
+class Echo:
+    """
+    A file-like object that hands back whatever is written to it, so csv.writer rows can be streamed.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_filters(user):
+
+    """
+    Get the appointment filters for an export.
+
+    Owners export every appointment, customers only their own.
+
+    Parameters:
+        user (UserProfile): The user requesting the export.
+
+    Returns:
+        dict: Field lookups for stream_appointments().
+    """
+
+    return {} if user.user_type == 'owner' else {'customer': user}
+
+
+@login_required
+def export_appointments_csv(request):
+
+    """
+    Export appointments as CSV.
+
+    Streams the user's appointments (every appointment for owners), optionally limited to the window given
+    by the 'start' and 'end' query parameters. Rows are written as they are read from the database, so memory
+    use stays constant and the response starts before the query has finished.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        StreamingHttpResponse: The CSV file as an attachment.
+    """
+
+    start, end = parse_window(request)
+    rows = stream_appointments(
+        ['date_time', 'id', 'duration', 'status', 'customer__username', 'customer__full_name'],
+        start, end, **export_filters(request.user)
+    )
+
+    writer = csv.writer(Echo())
+
+    def content():
+        yield writer.writerow(['id', 'date', 'time', 'duration_minutes', 'status', 'customer', 'full_name'])
+        for date_time, appointment_id, duration, status, username, full_name in rows:
+            local = timezone.localtime(date_time)
+            yield writer.writerow([
+                appointment_id,
+                local.strftime('%Y-%m-%d'),
+                local.strftime('%H:%M'),
+                int(duration.total_seconds() // 60) if duration else '',
+                status,
+                username,
+                full_name,
+            ])
+
+    response = StreamingHttpResponse(content(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="appointments.csv"'
+    return response
+
+
+@login_required
+def export_appointments_ics(request):
+
+    """
+    Export appointments as an iCalendar file.
+
+    Streams the user's appointments (every appointment for owners), optionally limited to the window given
+    by the 'start' and 'end' query parameters, as a .ics file calendar apps can import.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        StreamingHttpResponse: The iCalendar file as an attachment.
+    """
+
+    start, end = parse_window(request)
+    rows = stream_appointments(
+        ['date_time', 'id', 'duration', 'status', 'customer__full_name'],
+        start, end, **export_filters(request.user)
+    )
+
+    summary = 'Appointment with {full_name}' if request.user.user_type == 'owner' else 'Appointment'
+
+    response = StreamingHttpResponse(ical.calendar('Appointments', rows, summary), content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="appointments.ics"'
+    return response
+
+
+def calendar_feed(request, token):
+
+    """
+    Serve a user's calendar subscription feed.
+
+    Calendar apps poll this URL every few minutes. The ETag and Last-Modified headers come from the user's
+    schedule version, so a poll with nothing new is answered with 304 Not Modified from a single lookup of
+    the user, without querying appointments. The feed covers upcoming appointments and the last
+    CALENDAR_FEED_PAST_DAYS days.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+        token (str): The user's calendar token.
+
+    Returns:
+        StreamingHttpResponse: The iCalendar feed.
+        HttpResponseNotModified: If the client's copy is up to date.
+        Http404: Raises a 404 error if the token is unknown.
+    """
+
+    user = (
+        UserProfile.objects.filter(calendar_token=token)
+        .only('id', 'user_type', 'schedule_version', 'schedule_changed_at')
+        .first()
+    )
+    if user is None:
+        raise Http404("Calendar does not exist")
+
+    etag = f'"{user.pk}-{user.schedule_version}"'
+    last_modified = int(user.schedule_changed_at.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        rows = stream_appointments(
+            ['date_time', 'id', 'duration', 'status', 'customer__full_name'],
+            timezone.now() - timedelta(days=CALENDAR_FEED_PAST_DAYS), **export_filters(user)
+        )
+        summary = 'Appointment with {full_name}' if user.user_type == 'owner' else 'Appointment'
+        response = StreamingHttpResponse(ical.calendar('Appointments', rows, summary), content_type='text/calendar; charset=utf-8')
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+
+@staff_member_required
+def profiles(request):
+
+    """
+    List the stored request profiles.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: Renders the profile list, most recently used first.
+    """
+
+    return render(request, 'appointments/profiles.html', {'profiles': list_profiles()})
+
+
+@staff_member_required
+def profile_detail(request, request_id):
+
+    """
+    Show the hottest functions of a stored request profile.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object. ?sort=cumtime orders by cumulative instead of own time.
+        request_id (str): The request ID of the profile.
+
+    Returns:
+        HttpResponse: Renders the functions the request spent the most time in.
+        Http404: Raises a 404 error if there is no such profile.
+    """
+
+    sort = 'cumtime' if request.GET.get('sort') == 'cumtime' else 'tottime'
+    try:
+        meta, functions = hottest_functions(request_id, sort=sort)
+    except (FileNotFoundError, ValueError):
+        raise Http404('Profile does not exist')
+
+    return render(request, 'appointments/profile_detail.html', {
+        'request_id': request_id, 'meta': meta, 'functions': functions, 'sort': sort,
+    })
+
+
+def metrics_view(request):
+
+    """
+    Expose the runtime metrics of all worker processes in the Prometheus text format.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object. Needs an "Authorization: Bearer" header with
+            settings.METRICS_TOKEN when that is set.
+
+    Returns:
+        HttpResponse: The metrics.
+        HttpResponse: 401 if the token is missing or wrong.
+    """
+
+    if settings.METRICS_TOKEN and not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}',
+    ):
+        return HttpResponse(status=401)
+
+    return HttpResponse(metrics.render(metrics.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def accepted_encodings(request):
+
+    """
+    Get the content codings a request accepts, ignoring those refused with q=0.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        set: The lower-case coding names, e.g. {'gzip', 'br'}.
+    """
+
+    codings = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.partition(';')
+        quality = params.strip().removeprefix('q=')
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        if coding.strip():
+            codings.add(coding.strip().lower())
+    return codings
+
+
+def static_asset(request, path):
+
+    """
+    Serve a file collected into settings.STATIC_ROOT.
+
+    Picks the brotli or gzip variant written by CompressedManifestStaticFilesStorage when the browser accepts it.
+    Content-hashed names are cached by browsers for a year without revalidation; other names are revalidated
+    with Last-Modified.
+
+    Parameters:
+        request (HttpRequest): The HTTP request object.
+        path (str): The file path relative to STATIC_ROOT.
+
+    Returns:
+        FileResponse: The file, or its compressed variant with a Content-Encoding header.
+        HttpResponseNotModified: If an unhashed file has not changed since If-Modified-Since.
+        Http404: Raises a 404 error if there is no such file.
+    """
+
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Static file does not exist')
+    if not os.path.isfile(full_path):
+        raise Http404('Static file does not exist')
+    # Compressed variants are only served for their original's path, with a Content-Encoding header
+    for suffix in ENCODINGS.values():
+        if full_path.endswith(suffix) and os.path.isfile(full_path[:-len(suffix)]):
+            raise Http404('Static file does not exist')
+
+    immutable = path in hashed_names(staticfiles_storage)
+    if immutable:
+        cache_control = f'public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        cache_control = 'public, no-cache'
+        last_modified = int(os.path.getmtime(full_path))
+        response = get_conditional_response(request, last_modified=last_modified)
+        if response is not None:
+            response['Cache-Control'] = cache_control
+            return response
+
+    encoding = None
+    served_path = full_path
+    accepted = accepted_encodings(request)
+    for coding, suffix in ENCODINGS.items():
+        if coding in accepted and os.path.isfile(full_path + suffix):
+            encoding, served_path = coding, full_path + suffix
+            break
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    response = FileResponse(open(served_path, 'rb'), content_type=content_type or 'application/octet-stream')
+    # FileResponse names the file after the open file object, which would make every asset an inline download
+    del response['Content-Disposition']
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = cache_control
+    if not immutable:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+